@@ -94,10 +94,62 @@ class Config:
     can_slave: bool = get_toml('device', 'can_slave')
     can_sync: bool = get_toml('device', 'can_sync')
     park_az: int = get_toml('device', 'park_az')
+    calibration_file: str = get_toml('device', 'calibration_file')
+    status_interval: float = get_toml('device', 'status_interval')
+    status_min_interval: float = get_toml('device', 'status_min_interval')
+    status_max_interval: float = get_toml('device', 'status_max_interval')
+    dome_speed: float = get_toml('device', 'dome_speed')
+    slew_overhead: float = get_toml('device', 'slew_overhead')
+    shutter_time: float = get_toml('device', 'shutter_time')
+    breaker_threshold: int = get_toml('device', 'breaker_threshold')
+    probe_interval: float = get_toml('device', 'probe_interval')
+    # ---------------
+    # Focuser Section
+    # ---------------
+    foc_com_port: str = get_toml('focuser', 'com_port')
+    foc_baudrate: int = get_toml('focuser', 'baudrate')
+    temp_comp_interval: float = get_toml('focuser', 'temp_comp_interval')
+    temp_comp_min_samples: int = get_toml('focuser', 'temp_comp_min_samples')
+    temp_comp_min_move: int = get_toml('focuser', 'temp_comp_min_move')
+    foc_backlash: int = get_toml('focuser', 'backlash')
+    foc_approach_direction: int = get_toml('focuser', 'approach_direction')
+    foc_max_speed: float = get_toml('focuser', 'max_speed')
+    foc_acceleration: float = get_toml('focuser', 'acceleration')
+    foc_coalesce_moves: bool = get_toml('focuser', 'coalesce_moves')
+    foc_breaker_threshold: int = get_toml('focuser', 'breaker_threshold')
+    foc_probe_interval: float = get_toml('focuser', 'probe_interval')
+    # ---------------
+    # Slaving Section
+    # ---------------
+    site_latitude: float = get_toml('slaving', 'latitude')
+    site_longitude: float = get_toml('slaving', 'longitude')
+    dome_radius: float = get_toml('slaving', 'dome_radius')
+    mount_offset_n: float = get_toml('slaving', 'mount_offset_n')
+    mount_offset_e: float = get_toml('slaving', 'mount_offset_e')
+    mount_offset_u: float = get_toml('slaving', 'mount_offset_u')
+    dec_axis_offset: float = get_toml('slaving', 'dec_axis_offset')
+    slit_tolerance: float = get_toml('slaving', 'slit_tolerance')
+    slave_interval: float = get_toml('slaving', 'interval')
+    slave_lookahead: float = get_toml('slaving', 'lookahead')
+    slave_lookahead_step: float = get_toml('slaving', 'lookahead_step')
+    mount_url: str = get_toml('slaving', 'mount_url')
     # ---------------
     # Observing Conditions Section
     # ---------------
-    api_url: str = get_toml('observing', 'api_url')
+    api_url = get_toml('observing', 'api_url')      # str or list of str
+    source_timeout: float = get_toml('observing', 'source_timeout')
+    source_wait: float = get_toml('observing', 'source_wait')
+    source_max_age: float = get_toml('observing', 'source_max_age')
+    outlier_threshold: float = get_toml('observing', 'outlier_threshold')
+    source_priority: dict = get_toml('observing', 'source_priority')
+    weather_interval: float = get_toml('observing', 'interval')
+    weather_min_interval: float = get_toml('observing', 'min_interval')
+    weather_max_interval: float = get_toml('observing', 'max_interval')
+    weather_fast_interval: float = get_toml('observing', 'fast_interval')
+    average_period: float = get_toml('observing', 'average_period')
+    refresh_interval: float = get_toml('observing', 'refresh_interval')
+    weather_store_dir: str = get_toml('observing', 'store_dir')
+    weather_snapshot_file: str = get_toml('observing', 'snapshot_file')
     # ---------------
     # Safety Monitor Section
     # ---------------
@@ -107,6 +159,14 @@ class Config:
     max_temp: int = get_toml('safety', 'max_temp')
     max_leaf: int = get_toml('safety', 'max_leaf')
     risk_dew: int = get_toml('safety', 'risk_dew')
+    humidity_margin: float = get_toml('safety', 'humidity_margin')
+    wind_margin: float = get_toml('safety', 'wind_margin')
+    temp_margin: float = get_toml('safety', 'temp_margin')
+    snapshot_max_age: float = get_toml('safety', 'snapshot_max_age')
+    # ---------------
+    # Trace Section
+    # ---------------
+    trace_dir: str = get_toml('trace', 'record_dir')
     # ---------------
     # Logging Section
     # ---------------
@@ -8,6 +8,7 @@
 #
 # -----------------------------------------------------------------------------
 
+import json
 from falcon import Request, Response, HTTPBadRequest, before
 from logging import Logger
 from shr import PropertyResponse, MethodResponse, PreProcessRequest, \
@@ -76,6 +77,43 @@ class Action:
                 dome.flat_off()
                 resp.text = MethodResponse(req).json
 
+            elif action_name in ("telescopealtaz", "telescoperadec"):
+                # Parameters "a,b[,pierside]": alt,az (deg) or ra (h),dec (deg)
+                values = [float(v) for v in parameters.split(',')]
+                pier = int(values[2]) if len(values) > 2 else None
+                dome.set_telescope(action_name[len("telescope"):], values[0], values[1], pier)
+                resp.text = MethodResponse(req).json
+
+            elif action_name == "calibrate":
+                # Parameters: true azimuth (deg) of the dome at its current barcode
+                dome.calibrate(float(parameters))
+                resp.text = MethodResponse(req).json
+
+            elif action_name == "slavestatus":
+                resp.text = MethodResponse(req, value=json.dumps(dome.slave_status())).json
+
+            elif action_name == "slewstats":
+                resp.text = MethodResponse(req, value=json.dumps(dome.slew_stats())).json
+
+            elif action_name == "health":
+                resp.text = MethodResponse(req, value=json.dumps(dome.health())).json
+
+            elif action_name == "status":
+                resp.text = MethodResponse(req, value=json.dumps(dome.status_summary())).json
+
+            elif action_name == "shutterstate":
+                resp.text = MethodResponse(req, value=json.dumps(dome.shutter_state())).json
+
+            elif action_name == "jobstatus":
+                resp.text = MethodResponse(req, value=json.dumps(dome.job_status())).json
+
+            elif action_name == "eta":
+                # Parameters: optional target azimuth (deg) to predict a slew to
+                status = dome.slew_eta()
+                if parameters:
+                    status['Predicted'] = round(dome.predict_slew(float(parameters)), 1)
+                resp.text = MethodResponse(req, value=json.dumps(status)).json
+
             else:
                 resp.text = MethodResponse(req,
                                 InvalidValueException(f"Action '{action_name}' is not supported.")).json
@@ -130,7 +168,9 @@ class SupportedActions():
         """
         Returns the list of custom actions supported by the driver.
         """
-        actions = ["flaton", "flatoff"]
+        actions = ["flaton", "flatoff", "telescopealtaz", "telescoperadec", "slavestatus",
+                   "calibrate", "eta", "jobstatus", "shutterstate",
+                   "status", "health", "slewstats"]
         resp.text = PropertyResponse(actions, req).json
 
 @before(PreProcessRequest(maxdev))
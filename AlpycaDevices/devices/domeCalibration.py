@@ -0,0 +1,118 @@
+from logging import Logger
+from threading import Lock
+import numpy as np
+import sys
+import os
+
+class DomeCalibration():
+    """Barcode <-> azimuth calibration of the dome position reader.
+
+    The table (one ``barcode,azimuth`` pair per line, ``#`` comments) is
+    loaded from a file, or built from the nominal mapping of the Meade
+    controller (2 deg per barcode, 855 = 0 deg, 801..854 = 252..358 deg)
+    if there is none. Both directions are precomputed into dense arrays,
+    so conversions are a single index: barcodes missing from the table are
+    interpolated, and azimuths map to the nearest barcode on a grid of
+    ``resolution`` degrees. Observed true azimuths are blended in by
+    ``recalibrate()``; the dome has no azimuth reference of its own (a
+    settled slew only reports the barcode it stopped on), so they come
+    from an outside source through the "calibrate" Action.
+    """
+    def __init__(self, logger: Logger, path: str, resolution: float = 0.1):
+        self._lock = Lock()
+        self.logger = logger
+        if path and not os.path.isabs(path):
+            path = f'{sys.path[0]}/{path}'
+        self.path = path
+        self._resolution = resolution
+        self._table = {}
+        self.load()
+
+    @staticmethod
+    def nominal_table() -> dict:
+        table = {}
+        for barcode in range(801, 983):
+            if barcode >= 855:
+                table[barcode] = 2.0 * (barcode - 855)
+            else:
+                table[barcode] = 2.0 * (barcode - 675)
+        return table
+
+    def load(self) -> None:
+        table = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    line = line.split('#')[0].strip()
+                    if not line:
+                        continue
+                    barcode, azimuth = line.split(',')
+                    table[int(barcode)] = float(azimuth) % 360.0
+            self.logger.info(f'[Calibration] {len(table)} barcodes from {self.path}')
+        if len(table) < 2:
+            table = self.nominal_table()
+        self._build(table)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        self._lock.acquire()
+        table = dict(self._table)
+        self._lock.release()
+        with open(self.path, 'w') as f:
+            f.write('# barcode,azimuth\n')
+            for barcode in sorted(table):
+                f.write(f'{barcode},{table[barcode]:.3f}\n')
+
+    def _build(self, table: dict) -> None:
+        barcodes = np.array(sorted(table))
+        # Unwrap along the barcode strip so interpolation across 360/0 works
+        azimuths = np.degrees(np.unwrap(np.radians([table[b] for b in barcodes])))
+        first = int(barcodes[0])
+        dense = np.round(np.interp(np.arange(first, int(barcodes[-1]) + 1), barcodes, azimuths) % 360.0, 6)
+        grid = np.arange(0.0, 360.0, self._resolution)
+        distance = np.abs((dense[np.newaxis, :] - grid[:, np.newaxis] + 180.0) % 360.0 - 180.0)
+        nearest = np.argmin(distance, axis=1) + first
+        self._lock.acquire()
+        self._table = dict(table)
+        self._first = first
+        self._az_of_barcode = dense
+        self._barcode_of_az = nearest
+        self._lock.release()
+
+    def barcode_to_azimuth(self, barcode: float):
+        """Azimuth (deg) of a barcode, fractional barcodes interpolate. None if out of range."""
+        self._lock.acquire()
+        dense = self._az_of_barcode
+        first = self._first
+        self._lock.release()
+        pos = barcode - first
+        if pos < 0 or pos > len(dense) - 1:
+            return None
+        i = int(pos)
+        frac = pos - i
+        if frac == 0.0:
+            return float(dense[i])
+        step = (dense[i + 1] - dense[i] + 180.0) % 360.0 - 180.0
+        return float((dense[i] + frac * step) % 360.0)
+
+    def azimuth_to_barcode(self, azimuth: float) -> int:
+        """Barcode closest to the given azimuth (deg)"""
+        self._lock.acquire()
+        nearest = self._barcode_of_az
+        self._lock.release()
+        return int(nearest[int(round((azimuth % 360.0) / self._resolution)) % len(nearest)])
+
+    def recalibrate(self, barcode: int, azimuth: float, weight: float = 0.5) -> None:
+        """Blend an observed true azimuth for a barcode into the table and save it"""
+        self._lock.acquire()
+        table = dict(self._table)
+        self._lock.release()
+        old = table.get(barcode)
+        if old is None:
+            table[barcode] = azimuth % 360.0
+        else:
+            table[barcode] = (old + weight * ((azimuth - old + 180.0) % 360.0 - 180.0)) % 360.0
+        self._build(table)
+        self.save()
+        self.logger.info(f'[Calibration] barcode {barcode}: {old} -> {table[barcode]:.2f}')
@@ -1,13 +1,21 @@
-import serial
-import serial.tools.list_ports
 from logging import Logger
 
-from threading import Lock
+from threading import Lock, Timer
+import requests
 import re
-import math
 import time
 from config import Config, save_toml
 from exceptions import *
+from devices.transport import Transport
+from devices.health import CircuitOpenError
+from devices.domeCalibration import DomeCalibration
+from devices.domeMotion import DomeMotionModel, SlewTimeModel
+from devices.jobs import JobRegistry
+from devices.domeShutter import ShutterStateMachine, SHUTTER_ERROR
+from devices.domeStatus import DomeStatus, decode_status
+from devices.domeGeometry import dome_azimuth, equatorial_to_altaz, altaz_to_equatorial, \
+                                 default_pier_side, local_sidereal_time, predict_track, \
+                                 slave_decision
 
 class Dome():
     def __init__(self, logger: Logger):  
@@ -17,9 +25,14 @@ class Dome():
         
         self._altitude = 0.0
         self._azimuth = 0.0
+        self._barcode = None
+        self._status: DomeStatus = None # Latest status reading
+        self._status_seq = 0
+        self._calibration = DomeCalibration(logger, Config.calibration_file)
+        self._motion = DomeMotionModel()
         self._at_park = False
         self._at_home = False
-        self._shutter_status = 1
+        self._shutter = ShutterStateMachine(Config.shutter_time)
         self._home_az = 90 #degree
         self._park_az = Config.park_az #degree
         # Status Shutter:       0 = "The shutter or roof is open", 
@@ -40,18 +53,47 @@ class Dome():
         self._can_sync = Config.can_sync
 
         self._connected = False
-        self._serial = None
         self._timeout = 2
         self._port = Config.com_port
         self._baudrate = Config.com_baudrate
-    
-    def _ports(self):
-        self.list = serial.tools.list_ports.comports()
-        coms = []
-        for element in self.list:
-            coms.append(element.device)
+        self._transport = Transport(logger, self._port, self._baudrate, self._timeout,
+                                    terminator='\r\n', encoding='latin-1', post_delay=.2,
+                                    name='dome', trace_dir=Config.trace_dir,
+                                    breaker_threshold=Config.breaker_threshold,
+                                    probe_interval=Config.probe_interval)
+
+        # Background status poller, property reads use its latest reading
+        self._poll_interval = Config.status_interval
+        self._poll_min_interval = Config.status_min_interval
+        self._poll_max_interval = Config.status_max_interval
+        self._poll_timer: Timer = None
+
+        # Slew duration model, learned from the slews seen by the poller
+        self._travel = SlewTimeModel(Config.dome_speed, Config.slew_overhead)
+        self._slew = None               # Slew in progress, see _slew_to_azimuth
+        self._commanded_tag = None      # Barcode of the last MOVER command
+        self._slews_sent = 0
+        self._slews_suppressed = 0
 
-        return(coms)
+        # Find home, park and the shutter run as background jobs
+        self._jobs = JobRegistry(logger)
+
+        # Slaving engine
+        self._latitude = Config.site_latitude
+        self._longitude = Config.site_longitude
+        self._dome_radius = Config.dome_radius
+        self._mount_offset = (Config.mount_offset_n, Config.mount_offset_e, Config.mount_offset_u)
+        self._dec_axis_offset = Config.dec_axis_offset
+        self._slit_tolerance = Config.slit_tolerance
+        self._slave_interval = Config.slave_interval
+        self._lookahead = Config.slave_lookahead * 60.0     # sec, 0 = slave to the current position only
+        self._lookahead_step = Config.slave_lookahead_step
+        self._mount_url = Config.mount_url
+        self._telescope = None          # (kind, a, b, pier), kind is 'altaz' or 'radec'
+        self._slave_timer: Timer = None
+        self._slave_az = None           # Last required dome azimuth
+        self._slave_cmd_az = None       # Last azimuth commanded by the engine
+        self._slave_moves = 0
 
     @property
     def connected(self):
@@ -61,94 +103,201 @@ class Dome():
         return res
     @connected.setter
     def connected(self, connected: bool):
-        self._lock.acquire()
-        self._connected = connected
-        if connected and self._port in self._ports():
+        if connected:
+            # Connected only once the port is open
+            try:
+                if not self._transport.available():
+                    raise RuntimeError(f'Port {self._transport.port} not available')
+                self._transport.open()
+            except Exception as e:
+                self.logger.error(f'[connect] {e}')
+                raise RuntimeError('Cannot Connect')
+            self._lock.acquire()
+            self._connected = True
             self._lock.release()
-            self._serial = serial.Serial(
-                port=self._port,
-                baudrate=self._baudrate,                
-                timeout=self._timeout
-            )
-            self._serial.close()
-            if not self._serial.is_open:
-                try: 
-                    self._serial.open()
-                    self._serial.flush() 
-                    time.sleep(1)                   
-                except:
-                    raise RuntimeError('Cannot Connect')
-        elif not connected:
+        else:
+            self._lock.acquire()
+            self._connected = False
             self._lock.release()
             self.disconnect()
         if self._connected:
             self._write("MEADE DOMO INIT")
+            self.status()
+            self._start_polling()
             self.logger.info('[connected]')
         else:
             self.logger.info('[disconnected]')
     
     def disconnect(self):
-        self._lock.acquire()
-        if self._serial.is_open:
-            try:
-                self._serial.close()
-            except:
-                raise RuntimeError('Cannot disconnect')
-        self._lock.release()
+        self._jobs.cancel()
+        self._stop_polling()
+        try:
+            self._transport.close()
+        except:
+            raise RuntimeError('Cannot disconnect')
     
     def barcode_to_azimuth(self, dome_lcb):
-        if dome_lcb >= 855 and dome_lcb <= 982:
-            return 2 * (dome_lcb - 855)
-        elif dome_lcb < 855:
-            return 2 * (dome_lcb - 675)
+        return self._calibration.barcode_to_azimuth(dome_lcb)
+
+    def calibrate(self, azimuth: float):
+        """Record the true azimuth (e.g. from the telescope) at the current barcode"""
+        self.status()
+        self._lock.acquire()
+        barcode = self._barcode
+        self._lock.release()
+        if barcode is None:
+            raise RuntimeError('Dome position unknown')
+        self._calibration.recalibrate(barcode, float(azimuth))
+        self.status()
     
-    def status(self):
+    def _poll_delay(self) -> float:
+        # Poll slowly early in a long slew and fast around its predicted end
+        now = time.monotonic()
         self._lock.acquire()
+        slew = self._slew
+        self._lock.release()
+        remaining = [slew['eta'] - now] if slew is not None else []
+        shutter = self._shutter.remaining(now)
+        if shutter is not None:
+            remaining.append(shutter)
+        if not remaining:
+            return self._poll_interval
+        return max(self._poll_min_interval, min(self._poll_max_interval, min(remaining) / 2.0))
 
-        try:
-            ack = self._write("MEADE PROG STATUS")
-
-            if not ack or '*' not in ack:
-                self.logger.error(f'[Reading] Invalid Response from device.')
-                return
-
-            parts = ack.split('*')
-            if len(parts) != 2:
-                self.logger.error(f'[Reading] Malformed ACK')
-                return
+    def _start_polling(self, delay: float = None) -> None:
+        if delay is None:
+            delay = self._poll_delay()
+        self._lock.acquire()
+        if self._poll_timer is not None:
+            self._poll_timer.cancel()
+        self._poll_timer = Timer(delay, self._poll_run)
+        self._poll_timer.daemon = True
+        self._poll_timer.start()
+        self._lock.release()
 
-            try:
-                dome_lcb = int(parts[0].strip())
-            except ValueError:
-                self.logger.error(f'[Reading] Invalid LCB: {parts[0]}')
-                return
+    def _stop_polling(self) -> None:
+        self._lock.acquire()
+        if self._poll_timer is not None:
+            self._poll_timer.cancel()
+        self._poll_timer = None
+        self._lock.release()
 
-            raw_bits = parts[1].strip()
-            status_bits = ''.join(c for c in raw_bits if c in '01')
+    def _poll_run(self) -> None:
+        try:
+            self.status()
+        except CircuitOpenError:
+            pass                        # Failing fast, the breaker logs the state changes
+        except Exception as e:
+            self.logger.error(f'[Polling] {e}')
+        if self.connected:
+            self._start_polling()
 
-            if len(status_bits) < 8:
-                self.logger.error(f'[Reading] Incomplete bitfield')
-                return
+    def status(self):
+        # Serial round trip outside the lock, readers use the last state meanwhile
+        ack = self._write("MEADE PROG STATUS")
+        now = time.monotonic()
+        self._lock.acquire()
 
+        try:
             try:
-                self._slewing = bool(int(status_bits[3]))
-
-                shutter = int(status_bits[6])
-                if shutter == 1:
-                    self._shutter_status = 0
-                elif shutter == 0:
-                    self._shutter_status = 1
-
-            except Exception as e:
-                self.logger.error(f'[Parsing Bits] {e} | bits={status_bits}')
+                record = decode_status(ack, self._status_seq + 1, time.time(), self._calibration)
+            except ValueError as e:
+                self.logger.error(f'[Reading] {e}')
                 return
 
-            self._azimuth = self.barcode_to_azimuth(dome_lcb)
+            self._status_seq = record.seq
+            self._status = record
+            self._slewing = record.slewing
+            self._shutter.update(record.shutter_open, now)
+            self._barcode = record.barcode
+            self._azimuth = record.azimuth
             self._at_home = (self._home_az == self._azimuth)
+            self._motion.update(record.barcode, record.azimuth, record.slewing, now)
+            if self._slew is not None:
+                self._track_slew(now)
+            return record
 
         finally:
             self._lock.release()
+
+    @property
+    def status_record(self) -> DomeStatus:
+        """Latest decoded status reading, None before the first one"""
+        self._lock.acquire()
+        res = self._status
+        self._lock.release()
+        return res
+
+    def status_summary(self) -> dict:
+        """Latest reading with the derived dome state, for monitoring"""
+        record = self.status_record
+        res = record._asdict() if record is not None else {}
+        self._lock.acquire()
+        res['AtHome'] = self._at_home
+        res['AtPark'] = self._at_park
+        res['Slaved'] = self._slaved
+        self._lock.release()
+        res['Azimuth'] = self._motion.azimuth(time.monotonic())
+        res['Slewing'] = self.slewing
+        res['ShutterStatus'] = self._shutter.state
+        return res
     
+    def _track_slew(self, now: float) -> None:
+        # Called from status() with the lock held
+        slew = self._slew
+        if self._slewing:
+            slew['moving'] = True
+            if not slew['direction'] and self._motion.speed:
+                slew['direction'] = 1.0 if self._motion.speed > 0 else -1.0
+            return
+        if slew['moving']:
+            self._travel.record(slew['barcode'], slew['target'], slew['azimuth'], slew['target_az'],
+                                slew['direction'], now - slew['start'])
+            self.logger.info(f'[Slew] {now - slew["start"]:.1f}s, predicted {slew["eta"] - slew["start"]:.1f}s')
+            self._slew = None
+        elif self._barcode == slew['target'] or now - slew['start'] > self._poll_max_interval:
+            self._slew = None           # Already there, or the controller never started
+
+    def slew_stats(self) -> dict:
+        self._lock.acquire()
+        res = {
+            'CommandedBarcode': self._commanded_tag,
+            'Sent': self._slews_sent,
+            'Suppressed': self._slews_suppressed
+        }
+        self._lock.release()
+        return res
+
+    def predict_slew(self, azimuth: float) -> float:
+        """Predicted duration (sec) of a slew from the current position to ``azimuth``"""
+        tag = self._calibration.azimuth_to_barcode(float(azimuth))
+        self._lock.acquire()
+        barcode = self._barcode
+        current = self._azimuth
+        self._lock.release()
+        if barcode is None:
+            raise RuntimeError('Dome position unknown')
+        target_az = self._calibration.barcode_to_azimuth(tag)
+        return self._travel.duration(self._travel.distance(barcode, tag, current, target_az))
+
+    def slew_eta(self) -> dict:
+        self._lock.acquire()
+        slew = self._slew
+        slewing = self._slewing
+        self._lock.release()
+        res = {
+            'Slewing': slewing,
+            'TargetAzimuth': None,
+            'Duration': None,
+            'Remaining': 0.0
+        }
+        if slew is not None:
+            res['TargetAzimuth'] = slew['target_az']
+            res['Duration'] = round(slew['eta'] - slew['start'], 1)
+            res['Remaining'] = round(max(0.0, slew['eta'] - time.monotonic()), 1)
+        res['Model'] = self._travel.status()
+        return res
+
     @property
     def altitude(self) -> float:
         return
@@ -164,19 +313,19 @@ class Dome():
     
     @property
     def azimuth(self) -> float:
-        self.status()
         self._lock.acquire()
         if not self._can_set_az:            
             self._lock.release()
             raise RuntimeError("Does not support vertical (altitude) control ")
-        if self._azimuth == -1:
-            raise RuntimeError("Reading azimuth error")
         self._lock.release()
-        return self._azimuth
+        # Interpolated between barcodes while rotating, no serial traffic
+        res = self._motion.azimuth(time.monotonic())
+        if res is None:
+            raise RuntimeError("Reading azimuth error")
+        return res
     
     @property
     def at_home(self) -> bool:
-        self.status()
         self._lock.acquire()        
         res = self._at_home
         self._lock.release()
@@ -211,12 +360,8 @@ class Dome():
         return res
     
     @property
-    def shutter_status(self)-> bool:
-        self.status()
-        self._lock.acquire()
-        res = self._shutter_status
-        self._lock.release()
-        return res
+    def shutter_status(self)-> int:
+        return self._shutter.state
     
     @property
     def can_set_alt(self)-> bool:
@@ -248,11 +393,10 @@ class Dome():
     
     @property
     def slewing(self):
-        self.status()
         self._lock.acquire()
         res = self._slewing
         self._lock.release()
-        return res
+        return res or self._jobs.active('rotation')
     
     @property
     def slaved(self):
@@ -262,19 +406,175 @@ class Dome():
         return res
     @slaved.setter
     def slaved(self, slave: bool):
+        if slave and not self._can_slave:
+            raise RuntimeError('Dome cannot be slaved')
+        self._lock.acquire()
         self._slaved = slave
-        return
+        self._lock.release()
+        if slave:
+            self._start_slaving()
+        else:
+            self._stop_slaving()
+
+    def set_telescope(self, kind: str, a: float, b: float, pier: int = None):
+        """Telescope pointing for slaving, alt/az (deg) or RA (h)/Dec (deg)"""
+        if kind not in ('altaz', 'radec'):
+            raise RuntimeError(f'Unknown pointing kind {kind}')
+        self._lock.acquire()
+        self._telescope = (kind, float(a), float(b), pier)
+        self._lock.release()
+
+    def _poll_mount(self):
+        # Alpaca Telescope device, e.g. http://host:port/api/v1/telescope/0
+        params = {'ClientID': 1, 'ClientTransactionID': 0}
+        values = []
+        for prop in ('altitude', 'azimuth', 'sideofpier'):
+            response = requests.get(f'{self._mount_url}/{prop}', params=params, timeout=2)
+            if response.status_code != 200:
+                raise RuntimeError(f'Error polling mount {prop}: {response.status_code}')
+            values.append(response.json().get('Value'))
+        pier = values[2] if values[2] in (0, 1) else None
+        return ('altaz', float(values[0]), float(values[1]), pier)
+
+    def _telescope_altaz(self):
+        if self._mount_url:
+            telescope = self._poll_mount()
+        else:
+            self._lock.acquire()
+            telescope = self._telescope
+            self._lock.release()
+        if telescope is None:
+            return None
+        kind, a, b, pier = telescope
+        if kind == 'radec':
+            ha = local_sidereal_time(time.time(), self._longitude) - a
+            a, b = equatorial_to_altaz(ha, b, self._latitude)
+        return a, b, pier
+
+    def required_azimuth(self):
+        """Dome azimuth needed for the current telescope pointing, None if unknown"""
+        pointing = self._telescope_altaz()
+        if pointing is None:
+            return None
+        alt, az, pier = pointing
+        return float(dome_azimuth(alt, az, self._latitude, self._dome_radius,
+                                  self._mount_offset, self._dec_axis_offset, pier))
+
+    def required_track(self):
+        """Required dome azimuths along the predicted (sidereal) telescope track"""
+        pointing = self._telescope_altaz()
+        if pointing is None:
+            return None
+        alt, az, pier = pointing
+        ha, dec = altaz_to_equatorial(alt, az, self._latitude)
+        if pier is None:
+            pier = int(default_pier_side(ha))   # The mount will not flip during the track
+        alts, azs = predict_track(ha, dec, self._latitude, self._lookahead, self._lookahead_step)
+        return dome_azimuth(alts, azs, self._latitude, self._dome_radius,
+                            self._mount_offset, self._dec_axis_offset, pier)
+
+    def _start_slaving(self) -> None:
+        self._lock.acquire()
+        if self._slave_timer is not None:
+            self._slave_timer.cancel()
+        self._slave_timer = Timer(self._slave_interval, self._slave_run)
+        self._slave_timer.daemon = True
+        self._slave_timer.start()
+        self._lock.release()
+
+    def _stop_slaving(self) -> None:
+        self._lock.acquire()
+        if self._slave_timer is not None:
+            self._slave_timer.cancel()
+        self._slave_timer = None
+        self._slave_cmd_az = None
+        self._lock.release()
+
+    def _slave_run(self) -> None:
+        if not self.slaved:
+            return
+        try:
+            if self._lookahead > 0:
+                required = self.required_track()
+            else:
+                required = self.required_azimuth()
+            if required is not None:
+                self.status()
+                self._lock.acquire()
+                self._slave_az = float(required[0]) if self._lookahead > 0 else required
+                current = self._azimuth
+                commanded = self._slave_cmd_az if self._slewing else None
+                self._lock.release()
+                # Move only when the slit edge would be reached. While moving,
+                # retarget only if the required azimuth left the commanded one.
+                target = slave_decision(required, current, self._slit_tolerance, commanded)
+                if target is not None:
+                    self.logger.info(f'[Slaving] dome {str(current)} -> {target:.1f}')
+                    self._slew_to_azimuth(target)
+                    self._lock.acquire()
+                    self._slave_cmd_az = target
+                    self._slave_moves += 1
+                    self._lock.release()
+        except Exception as e:
+            self.logger.error(f'[Slaving] {e}')
+        if self.slaved:
+            self._start_slaving()
+
+    def slave_status(self) -> dict:
+        self._lock.acquire()
+        res = {
+            'Slaved': self._slaved,
+            'Telescope': self._telescope,
+            'RequiredAzimuth': self._slave_az,
+            'CommandedAzimuth': self._slave_cmd_az,
+            'Tolerance': self._slit_tolerance,
+            'Lookahead': self._lookahead,
+            'Moves': self._slave_moves
+        }
+        self._lock.release()
+        return res
     
     def at_park(self) -> bool:
         return False  
     
     def find_home(self) -> None:
-        self.abort()
+        self._lock.acquire()
+        self._at_park = False
+        self._lock.release()
+        self._jobs.submit('FindHome', self._home_job, group='rotation')
+
+    def _home_job(self, job) -> None:
+        job.progress = 'stopping'
+        self._abort()
         self.status()
+        deadline = time.monotonic() + self._poll_max_interval * 10
         while self._slewing:
-            time.sleep(1)
+            if job.wait(self._poll_interval):
+                return
+            if time.monotonic() > deadline:
+                raise RuntimeError('Dome did not stop')
         print('[Homing]')
-        self.slew_to_azimuth(self._home_az)
+        job.progress = 'slewing'
+        self._slew_and_wait(job, self._home_az)
+
+    def _slew_and_wait(self, job, azimuth: float) -> None:
+        # Slew and wait for the poller to see the dome stopped on the target barcode
+        timeout = 2.0 * self.predict_slew(azimuth) + 30.0
+        tag = self._slew_to_azimuth(azimuth)
+        if not self._slewing and self._barcode != tag:
+            raise RuntimeError(f'Slew to {azimuth} not acknowledged')
+        deadline = time.monotonic() + timeout
+        while not job.wait(self._poll_min_interval):
+            self._lock.acquire()
+            stopped = not self._slewing and self._slew is None
+            barcode = self._barcode
+            self._lock.release()
+            if stopped and barcode == tag:
+                return
+            if stopped:
+                raise RuntimeError(f'Dome stopped at barcode {barcode}, target {tag}')
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'Dome did not reach barcode {tag} in {timeout:.0f}s')
     
     def slew_to_altitude(self, alt: float):
         raise RuntimeError('Dome does not support Altitude Slew')
@@ -283,35 +583,85 @@ class Dome():
         self.logger.debug(f'[Slew] pos={str(azimuth)}')               
         if self._slaved:
             raise RuntimeError('Slaved')
+        self._jobs.cancel('rotation')
+        self._lock.acquire()
+        self._at_park = False
+        self._lock.release()
+        self._slew_to_azimuth(azimuth)
+
+    def _slew_to_azimuth(self, azimuth: float):
         if not self._can_set_az:
             raise RuntimeError('Dome does not support rotational (azimuth) control')
         
-        azimuth = float(azimuth)
-        if azimuth == 360:
-            azimuth = 0
-        if azimuth >= 0 and azimuth < 252:
-            tag = 855 + math.ceil((azimuth) / 2)  
-        elif azimuth >= 252 and azimuth < 360:
-            tag = 675 + math.ceil((azimuth) / 2)
+        tag = self._calibration.azimuth_to_barcode(float(azimuth))
+        target_az = self._calibration.barcode_to_azimuth(tag)
+
+        # Already there, or already heading there: nothing to send
+        self._lock.acquire()
+        redundant = (not self._slewing and self._barcode == tag) or \
+                    (self._slewing and self._commanded_tag == tag)
+        if redundant:
+            self._slews_suppressed += 1
+        self._lock.release()
+        if redundant:
+            self.logger.debug(f'[SlewToAzimuth] barcode {tag} already commanded')
+            return tag
 
         self._slewing = 'ACK' in self._write("MEADE DOMO MOVER = " + str(tag))
         self._lock.acquire()
         print('[SlewToAzimuth]', self._slewing)
-        self._lock.release() 
+        self._slews_sent += 1
+        self._commanded_tag = tag if self._slewing else None
+        if self._slewing and self._barcode is not None:
+            distance = self._travel.distance(self._barcode, tag, self._azimuth, target_az)
+            start = time.monotonic()
+            self._slew = {
+                'start': start,
+                'eta': start + self._travel.duration(distance),
+                'barcode': self._barcode,
+                'azimuth': self._azimuth,
+                'target': tag,
+                'target_az': target_az,
+                'direction': 0.0,
+                'moving': False
+            }
+            self._motion.start_slew(target_az, self._travel.rotation(self._barcode, tag, self._azimuth, target_az),
+                                    start)
+        self._lock.release()
+        if self._slewing and self.connected:
+            self._start_polling(self._poll_min_interval)
+        return tag
     
     def close_shutter(self)-> None:
         if not self._can_set_shutter:
             raise RuntimeError('Cannot set Shutter')
-        
-        ret = 'ACK' in self._write(f"MEADE TRAPEIRA FECHAR")
+        seq = self._shutter.command(False, time.monotonic())
+        self._jobs.submit('CloseShutter', self._shutter_job, False, seq, group='shutter')
+
+    def _shutter_job(self, job, opening: bool, seq: int) -> None:
+        cmd = "MEADE TRAPEIRA ABRIR" if opening else "MEADE TRAPEIRA FECHAR"
+        try:
+            ret = 'ACK' in self._write(cmd)
+            if not ret:
+                ret = 'ACK' in self._write(cmd)
+        except RuntimeError:
+            self._shutter.fail()
+            raise
         if not ret:
-            ret = 'ACK' in self._write(f"MEADE TRAPEIRA FECHAR")
-            if not ret:    
-                self._shutter_status = 4        
-                raise RuntimeError('Dome close FAIL!')            
-        self._lock.acquire()
-        self._shutter_status = 3
-        self._lock.release()
+            self._shutter.fail()
+            raise RuntimeError(f'Dome {"open" if opening else "close"} FAIL!')
+        if self.connected:
+            self._start_polling(self._poll_min_interval)
+        # The state machine ends the movement from the status stream
+        while not job.cancelled:
+            state = self._shutter.wait(seq, self._poll_max_interval)
+            if state == SHUTTER_ERROR:
+                raise RuntimeError(f'Shutter not {"open" if opening else "closed"} in time')
+            if state is not None:
+                return
+
+    def shutter_state(self) -> dict:
+        return self._shutter.status()
     
     def set_park(self):
         if not self._can_set_park:
@@ -328,26 +678,33 @@ class Dome():
         if self._at_park:
             raise ParkedException()
 
-        self._lock.acquire()
-        self._at_park = True
-        self._lock.release()
-        self.slew_to_azimuth(self._home_az)
+        self._jobs.submit('Park', self._park_job, group='rotation')
+
+    def _park_job(self, job) -> None:
+        self._slew_and_wait(job, self._park_az)
+        if not job.cancelled:
+            self._lock.acquire()
+            self._at_park = True
+            self._lock.release()
+
+    def health(self) -> dict:
+        breaker = self._transport.breaker
+        return breaker.status() if breaker is not None else {}
+
+    def job_status(self) -> list:
+        return self._jobs.status()
 
     def open_shutter(self)-> None:
         if not self._can_set_shutter:
             raise RuntimeError('Cannot set Shutter')
-        
-        ret = 'ACK' in self._write(f"MEADE TRAPEIRA ABRIR")
-        if not ret:
-            ret = 'ACK' in self._write(f"MEADE TRAPEIRA ABRIR")
-            if not ret:    
-                self._shutter_status = 4        
-                raise RuntimeError('Dome close FAIL!')            
-        self._lock.acquire()
-        self._shutter_status = 2
-        self._lock.release()
+        seq = self._shutter.command(True, time.monotonic())
+        self._jobs.submit('OpenShutter', self._shutter_job, True, seq, group='shutter')
+
+    def abort(self) -> None:
+        self._jobs.cancel('rotation')
+        self._abort()
 
-    def abort(self) -> None:        
+    def _abort(self) -> None:        
         print('[AbortSlew] Aborting...')
         resp = 'ACK' in self._write("MEADE DOMO PARAR")
         self._write("MEADE PROG PARAR")
@@ -357,6 +714,8 @@ class Dome():
             raise RuntimeError('Dome Abort FAIL!')
         self._lock.acquire()
         self._slewing = False
+        self._slew = None
+        self._commanded_tag = None
         self._lock.release()
     
     def flat_on(self) -> None:
@@ -398,19 +757,4 @@ class Dome():
             self.logger.info('[FlatLamp] Successfully turned OFF')
     
     def _write(self, cmd):
-        if self._serial.is_open:
-            try: 
-                raw_cmd = cmd   
-                
-                cmd = (cmd + '\r\n').encode('ascii')
-                self._serial.write(cmd)
-                time.sleep(.2)
-                ack = self._serial.readline().decode('latin-1').rstrip() 
-                # if "STATUS" in raw_cmd:
-                #     print(ack) # DEBUG                        
-                return ack
-            except Exception as e:
-                print("Error writing COM: "+ str(e))
-                return "Error"
-        else:
-            return "Not Open"
\ No newline at end of file
+        return self._transport.query(cmd)
\ No newline at end of file
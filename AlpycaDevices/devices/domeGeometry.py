@@ -0,0 +1,122 @@
+import numpy as np
+
+# -----------------------------------------------------------------------------
+# Telescope to dome geometry for dome slaving
+#
+# Local frame is (North, East, Up) in meters, origin at the dome center.
+# Angles are in degrees, hour angles and sidereal time in hours. All
+# functions take scalars or NumPy arrays and broadcast.
+# -----------------------------------------------------------------------------
+
+PIER_EAST = 0           # ASCOM PierSide values
+PIER_WEST = 1
+
+def altaz_to_vector(alt, az) -> np.ndarray:
+    """Unit vectors (..., 3) for the given altitude/azimuth"""
+    alt = np.radians(alt)
+    az = np.radians(az)
+    return np.stack(np.broadcast_arrays(np.cos(alt) * np.cos(az),
+                                        np.cos(alt) * np.sin(az),
+                                        np.sin(alt)), axis=-1)
+
+def equatorial_to_altaz(ha, dec, latitude):
+    """Hour angle (h) and declination to ``(alt, az)``, azimuth from North through East"""
+    h = np.radians(np.asarray(ha) * 15.0)
+    d = np.radians(dec)
+    phi = np.radians(latitude)
+    alt = np.arcsin(np.sin(phi) * np.sin(d) + np.cos(phi) * np.cos(d) * np.cos(h))
+    az = np.arctan2(-np.cos(d) * np.sin(h),
+                    np.sin(d) * np.cos(phi) - np.cos(d) * np.sin(phi) * np.cos(h))
+    return np.degrees(alt), np.degrees(az) % 360.0
+
+def altaz_to_equatorial(alt, az, latitude):
+    """Altitude/azimuth to ``(ha, dec)``, hour angle in hours (-12..12)"""
+    a = np.radians(alt)
+    z = np.radians(az)
+    phi = np.radians(latitude)
+    dec = np.arcsin(np.sin(phi) * np.sin(a) + np.cos(phi) * np.cos(a) * np.cos(z))
+    ha = np.arctan2(-np.sin(z) * np.cos(a),
+                    np.sin(a) * np.cos(phi) - np.cos(a) * np.sin(phi) * np.cos(z))
+    return np.degrees(ha) / 15.0, np.degrees(dec)
+
+def local_sidereal_time(unix_time, longitude):
+    """Local mean sidereal time (h) at the given Unix time(s), longitude East positive"""
+    days = np.asarray(unix_time) / 86400.0 + 2440587.5 - 2451545.0
+    gmst = 18.697374558 + 24.06570982441908 * days
+    return (gmst + longitude / 15.0) % 24.0
+
+def azimuth_difference(a, b):
+    """Signed shortest angle (deg) from ``b`` to ``a``, in [-180, 180)"""
+    return (np.asarray(a) - b + 180.0) % 360.0 - 180.0
+
+def default_pier_side(ha):
+    """Pier side of a German mount in normal (counterweight down) pointing"""
+    return np.where(np.asarray(ha) < 0, PIER_WEST, PIER_EAST)
+
+def dome_azimuth(alt, az, latitude: float, radius: float, offset=(0.0, 0.0, 0.0),
+                 dec_offset: float = 0.0, pier=None):
+    """Dome azimuth (deg) where the telescope optical axis leaves the dome.
+
+    Args:
+        alt, az: Telescope pointing
+        latitude: Site latitude (deg)
+        radius: Dome radius (m)
+        offset: (north, east, up) of the mount axes intersection from the dome center (m)
+        dec_offset: Distance of the optical axis from the polar axis along the
+            declination axis (m), 0 for a fork or alt-az mount
+        pier: ASCOM PierSide of a German mount, None for normal pointing
+    """
+    d = altaz_to_vector(alt, az)
+    p = np.broadcast_to(np.asarray(offset, dtype=float), d.shape).copy()
+    if dec_offset:
+        pole = altaz_to_vector(abs(latitude), 0.0 if latitude >= 0 else 180.0)
+        axis = np.cross(pole, d)
+        norm = np.linalg.norm(axis, axis=-1, keepdims=True)
+        axis = np.divide(axis, norm, out=np.zeros_like(axis), where=norm > 1e-9)
+        if pier is None:
+            pier = default_pier_side(altaz_to_equatorial(alt, az, latitude)[0])
+        # pole x pointing is West at the meridian in the North, East in the South
+        side = np.where(np.asarray(pier) == PIER_WEST, 1.0, -1.0) * (1.0 if latitude >= 0 else -1.0)
+        p += (dec_offset * side)[..., np.newaxis] * axis
+    # Ray/sphere intersection, the origin is inside the dome so take the far root
+    b = np.sum(p * d, axis=-1)
+    c = np.sum(p * p, axis=-1) - radius * radius
+    t = -b + np.sqrt(np.maximum(b * b - c, 0.0))
+    q = p + t[..., np.newaxis] * d
+    return np.degrees(np.arctan2(q[..., 1], q[..., 0])) % 360.0
+
+SIDEREAL_RATE = 1.00273790935   # Sidereal hours per solar hour
+
+def predict_track(ha, dec, latitude: float, duration: float, step: float):
+    """Alt/az arrays of a sidereally tracked target over the next ``duration`` seconds"""
+    t = np.arange(0.0, duration + step, step)
+    return equatorial_to_altaz(ha + SIDEREAL_RATE * t / 3600.0, dec, latitude)
+
+def lead_azimuth(required, tolerance: float):
+    """Dome azimuth covering the longest initial stretch of a required azimuth track.
+
+    Returns ``(azimuth, index)``: the azimuth at the middle of the range of
+    ``required[0..index]``, the longest prefix that fits within the slit
+    tolerance on both sides, so a single move lasts as long as possible.
+    """
+    track = np.degrees(np.unwrap(np.radians(np.atleast_1d(required))))
+    hi = np.maximum.accumulate(track)
+    lo = np.minimum.accumulate(track)
+    fits = (hi - lo) <= 2.0 * tolerance
+    k = len(track) - 1 if fits.all() else int(np.argmin(fits)) - 1
+    return float((hi[k] + lo[k]) / 2.0 % 360.0), k
+
+def slave_decision(required, current: float, tolerance: float, commanded: float = None):
+    """New dome target for slaving or None if the dome can stay.
+
+    ``required`` is the required dome azimuth now, or the predicted track of
+    it (``required[0]`` is now) for lookahead slaving. The dome moves when
+    the slit edge is reached, while moving only if the target went stale.
+    """
+    required = np.atleast_1d(required)
+    reference = current if commanded is None else commanded
+    if abs(azimuth_difference(required[0], reference)) <= tolerance:
+        return None
+    if len(required) == 1:
+        return float(required[0] % 360.0)
+    return lead_azimuth(required, tolerance)[0]
@@ -0,0 +1,195 @@
+from threading import Lock
+from devices.fitting import IncrementalFit
+
+def _wrap(angle: float) -> float:
+    return (angle + 180.0) % 360.0 - 180.0
+
+class DomeMotionModel():
+    """Continuous dome azimuth from the 2 deg barcode readings.
+
+    The status poller feeds every reading with its time stamp. A change of
+    one barcode is a transition across the boundary between the two,
+    time stamped half way between the two polls that saw it; a change of
+    several barcodes (slow polling early in a long slew) gives the speed
+    over the whole poll interval, from the barcode seen at the last poll.
+    The rotation speed (signed, deg/sec) is smoothed over these samples,
+    and while the dome moves the azimuth is extrapolated from the last
+    reference point, never past the slew target (or further than one
+    barcode if there is none). At rest the barcode azimuth is used. A slew
+    can seed the speed from the expected rotation until one is observed.
+    """
+    def __init__(self, step: float = 2.0, smoothing: float = 0.5, max_gap: float = 30.0):
+        self._lock = Lock()
+        self._step = step               # deg per barcode
+        self._smoothing = smoothing     # Weight of the newest speed sample
+        self._max_gap = max_gap         # Transitions further apart (sec) are not consecutive
+        self._barcode = None
+        self._azimuth = None            # Azimuth of the current barcode
+        self._poll_time = None
+        self._boundary = None           # (time, azimuth) to extrapolate from
+        self._speed = 0.0
+        self._observed = False          # Speed seen from readings, not only seeded
+        self._target = None             # Azimuth the dome is slewing to
+        self._moving = False
+
+    def _add_speed(self, speed: float) -> None:
+        # Lock must be held by the caller
+        if not self._observed or self._speed == 0.0 or speed * self._speed < 0:
+            self._speed = speed
+        else:
+            self._speed += self._smoothing * (speed - self._speed)
+        self._observed = True
+
+    def start_slew(self, target: float, speed: float, t: float) -> None:
+        """A slew to ``target`` (deg) was commanded at ``t``, expected to rotate
+        at ``speed`` (signed deg/sec, 0 if unknown)"""
+        self._lock.acquire()
+        self._target = target
+        if not self._observed and speed and self._azimuth is not None:
+            self._speed = speed
+            self._boundary = (t, self._azimuth)
+        self._lock.release()
+
+    def update(self, barcode: int, azimuth: float, moving: bool, t: float) -> None:
+        self._lock.acquire()
+        try:
+            if azimuth is None:
+                # Barcode outside the calibration, keep the last position
+                self._moving = moving
+                return
+            if self._azimuth is not None and barcode != self._barcode:
+                delta = _wrap(azimuth - self._azimuth)
+                if abs(delta) <= 1.5 * self._step:
+                    t_cross = (t + self._poll_time) / 2.0
+                    crossing = (self._azimuth + delta / 2.0) % 360.0
+                    if self._boundary is not None:
+                        dt = t_cross - self._boundary[0]
+                        if 0 < dt <= self._max_gap:
+                            self._add_speed(_wrap(crossing - self._boundary[1]) / dt)
+                    self._boundary = (t_cross, crossing)
+                else:
+                    dt = t - self._poll_time
+                    if self._moving and 0 < dt <= self._max_gap:
+                        self._add_speed(delta / dt)
+                    self._boundary = (t, azimuth)
+            if not moving:
+                self._speed = 0.0
+                self._observed = False
+                self._boundary = None
+                self._target = None
+            self._moving = moving
+            self._barcode = barcode
+            self._azimuth = azimuth
+            self._poll_time = t
+        finally:
+            self._lock.release()
+
+    def azimuth(self, t: float):
+        """Estimated azimuth (deg) at time ``t``, None before the first reading"""
+        self._lock.acquire()
+        try:
+            if not self._moving or self._boundary is None or self._speed == 0.0:
+                return self._azimuth
+            t_ref, reference = self._boundary
+            travel = self._speed * (t - t_ref)
+            if self._target is None:
+                travel = max(-self._step, min(self._step, travel))
+            elif self._speed > 0:
+                travel = min(travel, (self._target - reference) % 360.0)
+            else:
+                travel = max(travel, -((reference - self._target) % 360.0))
+            return round(round(reference + travel, 2) % 360.0, 2)
+        finally:
+            self._lock.release()
+
+    @property
+    def speed(self) -> float:
+        """Rotation speed (deg/sec) seen from the readings, positive clockwise
+        (increasing azimuth), 0 if none yet"""
+        self._lock.acquire()
+        res = self._speed if self._observed else 0.0
+        self._lock.release()
+        return res
+
+class SlewTimeModel():
+    """Predicts dome slew durations, learned from the slews the dome makes.
+
+    A slew of ``d`` degrees takes ``d / v + v / a`` seconds with a trapezoidal
+    speed profile, so the duration is a straight line in the distance. Its
+    slope (1/v) and intercept (acceleration/deceleration overhead, v/a) are
+    fitted incrementally, starting from the nominal values until enough slews
+    are seen. The controller drives towards the target barcode, which may or
+    may not be the short way round; which one it does is voted on from the
+    direction the dome was seen to rotate when the two differ.
+    """
+    def __init__(self, speed: float, overhead: float, step: float = 2.0, min_slews: int = 3):
+        self._lock = Lock()
+        self._speed = speed             # Nominal deg/sec
+        self._overhead = overhead       # Nominal sec
+        self._step = step               # deg per barcode
+        self._min_slews = min_slews
+        self._fit = IncrementalFit()
+        self._short_votes = 0
+        self._strip_votes = 0
+
+    def _distances(self, start_barcode: int, target_barcode: int, start_az: float, target_az: float):
+        short = _wrap(target_az - start_az)
+        strip = (target_barcode - start_barcode) * self._step
+        return short, strip
+
+    def distance(self, start_barcode: int, target_barcode: int, start_az: float, target_az: float) -> float:
+        """Degrees the dome is expected to rotate"""
+        short, strip = self._distances(start_barcode, target_barcode, start_az, target_az)
+        self._lock.acquire()
+        use_strip = self._strip_votes > self._short_votes
+        self._lock.release()
+        return abs(strip) if use_strip else abs(short)
+
+    def rotation(self, start_barcode: int, target_barcode: int, start_az: float, target_az: float) -> float:
+        """Expected signed speed (deg/sec) of a slew, positive clockwise"""
+        short, strip = self._distances(start_barcode, target_barcode, start_az, target_az)
+        fit = self._fit.solve() if self._fit.count >= self._min_slews else None
+        speed = 1.0 / fit[0] if fit is not None and fit[0] > 0 else self._speed
+        self._lock.acquire()
+        use_strip = self._strip_votes > self._short_votes
+        self._lock.release()
+        way = strip if use_strip else short
+        return 0.0 if way == 0 else (speed if way > 0 else -speed)
+
+    def duration(self, distance: float) -> float:
+        """Predicted duration (sec) of a slew of ``distance`` degrees"""
+        if distance <= 0:
+            return 0.0
+        fit = self._fit.solve() if self._fit.count >= self._min_slews else None
+        if fit is None or fit[0] <= 0:
+            return self._overhead + distance / self._speed
+        return max(0.0, fit[1]) + fit[0] * distance
+
+    def record(self, start_barcode: int, target_barcode: int, start_az: float, target_az: float,
+               direction: float, duration: float) -> None:
+        """Learn from a completed slew, ``direction`` is the sign of the observed rotation (0 if unknown)"""
+        short, strip = self._distances(start_barcode, target_barcode, start_az, target_az)
+        self._lock.acquire()
+        if direction and short * strip < 0:
+            if direction * short > 0:
+                self._short_votes += 1
+            else:
+                self._strip_votes += 1
+        self._lock.release()
+        if direction and direction * strip > 0 and short * strip < 0:
+            distance = abs(strip)
+        else:
+            distance = abs(short)
+        if distance > self._step:
+            self._fit.add(distance, duration)
+
+    def status(self) -> dict:
+        fit = self._fit.solve()
+        speed = 1.0 / fit[0] if fit and fit[0] > 0 else None
+        return {
+            'Slews': self._fit.count,
+            'Speed': speed,                                             # deg/sec
+            'Acceleration': speed / fit[1] if speed and fit[1] > 0 else None,   # deg/sec^2
+            'ShortWayVotes': self._short_votes,
+            'BarcodeOrderVotes': self._strip_votes
+        }
@@ -0,0 +1,102 @@
+from threading import Condition
+
+# ASCOM ShutterState values
+SHUTTER_OPEN = 0
+SHUTTER_CLOSED = 1
+SHUTTER_OPENING = 2
+SHUTTER_CLOSING = 3
+SHUTTER_ERROR = 4
+
+class ShutterStateMachine():
+    """Shutter state driven by the shutter bit of the status stream.
+
+    ``command()`` starts a movement (opening/closing) and every status
+    reading goes through ``update()``: the movement completes when the bit
+    reaches the commanded end, or goes to error when that takes longer than
+    ``timeout`` times the expected travel time. An error clears if the bit
+    gets there late, and an error with no movement (``fail()``) clears
+    once the bit reads the same ``steady`` times in a row. At rest the bit
+    is followed, so moving the shutter from the local panel is seen too.
+    Every change of state notifies the threads blocked in ``wait()``.
+    """
+    def __init__(self, travel_time: float, timeout: float = 1.5, steady: int = 3):
+        self._cond = Condition()
+        self._travel_time = travel_time     # Expected open/close time (sec)
+        self._timeout = timeout             # Error after timeout * travel_time
+        self._state = SHUTTER_CLOSED
+        self._target = None                 # True = opening, False = closing
+        self._started = None
+        self._seq = 0                       # Movement counter
+        self._last_travel = None            # Duration (sec) of the last movement
+        self._steady = steady
+        self._last_bit = None               # Last bit read, and readings in a row with it
+        self._same_bits = 0
+
+    def _set(self, state: int) -> None:
+        # Called with the condition held
+        if state != self._state:
+            self._state = state
+            self._cond.notify_all()
+
+    @property
+    def state(self) -> int:
+        with self._cond:
+            return self._state
+
+    def command(self, opening: bool, t: float) -> int:
+        """Start a movement, returns its sequence number for ``wait()``"""
+        with self._cond:
+            self._seq += 1
+            self._target = opening
+            self._started = t
+            self._state = SHUTTER_OPENING if opening else SHUTTER_CLOSING
+            self._cond.notify_all()
+            return self._seq
+
+    def fail(self) -> None:
+        with self._cond:
+            self._target = None
+            self._same_bits = 0
+            self._set(SHUTTER_ERROR)
+
+    def update(self, is_open: bool, t: float) -> None:
+        with self._cond:
+            self._same_bits = self._same_bits + 1 if is_open == self._last_bit else 1
+            self._last_bit = is_open
+            if self._target is None:
+                if self._state != SHUTTER_ERROR or self._same_bits >= self._steady:
+                    self._set(SHUTTER_OPEN if is_open else SHUTTER_CLOSED)
+                return
+            if is_open == self._target:
+                self._last_travel = t - self._started
+                self._target = None
+                self._set(SHUTTER_OPEN if is_open else SHUTTER_CLOSED)
+            elif t - self._started > self._timeout * self._travel_time:
+                self._set(SHUTTER_ERROR)
+
+    def remaining(self, t: float):
+        """Expected time (sec) to the end of the movement, None at rest or
+        after it timed out"""
+        with self._cond:
+            if self._target is None or self._state == SHUTTER_ERROR:
+                return None
+            return self._started + self._travel_time - t
+
+    def wait(self, seq: int, timeout: float):
+        """Wait for movement ``seq`` to end, returns the final state or None
+        if it is still moving after ``timeout`` or another one started"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != seq or self._state not in
+                                (SHUTTER_OPENING, SHUTTER_CLOSING), timeout)
+            if self._seq != seq or self._state in (SHUTTER_OPENING, SHUTTER_CLOSING):
+                return None
+            return self._state
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                'State': self._state,
+                'Target': None if self._target is None else ('open' if self._target else 'closed'),
+                'TravelTime': self._travel_time,
+                'LastTravel': self._last_travel
+            }
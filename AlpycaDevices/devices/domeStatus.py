@@ -0,0 +1,40 @@
+from typing import NamedTuple
+
+class DomeStatus(NamedTuple):
+    """One decoded ``MEADE PROG STATUS`` reply.
+
+    The reply is ``<barcode> * <8 bits>``, bits numbered from the left as
+    sent by the controller. Only the slewing (3) and shutter (6) bits have
+    a known meaning; the others are kept under their position.
+    """
+    seq: int                # Reading counter since start
+    timestamp: float        # Epoch seconds
+    barcode: int
+    azimuth: float          # Azimuth of the barcode, None if out of the table
+    word: int               # The 8 bits, bit 0 is the most significant
+    bit0: bool
+    bit1: bool
+    bit2: bool
+    slewing: bool           # bit 3
+    bit4: bool
+    bit5: bool
+    shutter_open: bool      # bit 6
+    bit7: bool
+
+def decode_status(reply: str, seq: int, timestamp: float, calibration) -> DomeStatus:
+    """Decode a status reply, ValueError if it is malformed"""
+    if not reply or '*' not in reply:
+        raise ValueError('Invalid Response from device.')
+    parts = reply.split('*')
+    if len(parts) != 2:
+        raise ValueError('Malformed ACK')
+    try:
+        barcode = int(parts[0].strip())
+    except ValueError:
+        raise ValueError(f'Invalid LCB: {parts[0]}')
+    bits = parts[1].replace(' ', '').strip()[:8]
+    if len(bits) < 8 or bits.strip('01'):
+        raise ValueError(f'Incomplete bitfield: {parts[1]}')
+    word = int(bits, 2)
+    flags = [bool(word & (0x80 >> i)) for i in range(8)]
+    return DomeStatus(seq, timestamp, barcode, calibration.barcode_to_azimuth(barcode), word, *flags)
@@ -0,0 +1,46 @@
+from threading import Lock
+
+class IncrementalFit():
+    """Straight line fit ``y = intercept + slope * x`` by running sums.
+
+    Each sample only updates five sums, so adding a sample and reading
+    the fit are both O(1) no matter how many samples have been seen.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self._n = 0
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+
+    def add(self, x: float, y: float):
+        self._lock.acquire()
+        self._n += 1
+        self._sx += x
+        self._sy += y
+        self._sxx += x * x
+        self._sxy += x * y
+        self._lock.release()
+
+    @property
+    def count(self) -> int:
+        return self._n
+
+    def solve(self):
+        """Returns ``(slope, intercept)`` or None while the fit is undetermined"""
+        self._lock.acquire()
+        n, sx, sy, sxx, sxy = self._n, self._sx, self._sy, self._sxx, self._sxy
+        self._lock.release()
+        if n < 2:
+            return None
+        den = n * sxx - sx * sx
+        # All samples at (nearly) the same x, no slope can be learned yet
+        if abs(den) < 1e-9 * max(1.0, n * sxx):
+            return None
+        slope = (n * sxy - sx * sy) / den
+        intercept = (sy - slope * sx) / n
+        return slope, intercept
@@ -12,6 +12,7 @@
 #
 # ??-???-????   abc Initial edit
 
+import json
 from falcon import Request, Response, HTTPBadRequest, before
 from logging import Logger
 from shr import PropertyResponse, MethodResponse, PreProcessRequest, \
@@ -19,6 +20,7 @@ from shr import PropertyResponse, MethodResponse, PreProcessRequest, \
 from exceptions import *        
 
 from devices.focuserDevice import Focuser
+from devices import observingConditions
 
 logger: Logger = None
 
@@ -52,15 +54,60 @@ class FocuserMetadata:
 # RESOURCE CONTROLLERS
 # --------------------
 
+def _ambient_temperature() -> float:
+    # TempComp follows the weather station served by ObservingConditions
+    obs = observingConditions.obsC_dev
+    if obs is None or not obs.connected:
+        raise RuntimeError('ObservingConditions is not connected')
+    return obs.temperature
+
 def start_foc_device(logger: logger):
     logger = logger
     global foc_dev
     foc_dev = Focuser(logger)
+    foc_dev.temp_source = _ambient_temperature
 
 @before(PreProcessRequest(maxdev))
 class Action:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        resp.text = MethodResponse(req, NotImplementedException()).json
+        """
+        Executes the specified action.
+        """
+        if not foc_dev.connected:
+            resp.text = MethodResponse(req, NotConnectedException()).json
+            return
+
+        try:
+            action_name = get_request_field('Action', req).lower()
+
+            parameters = get_request_field('Parameters', req, default="")
+
+            if action_name == "tempcompsample":
+                # Optional best focus position, defaults to the current position
+                position = int(parameters) if parameters else None
+                foc_dev.add_focus_sample(position)
+                resp.text = MethodResponse(req).json
+
+            elif action_name == "tempcompstatus":
+                resp.text = MethodResponse(req, value=json.dumps(foc_dev.temp_comp_status())).json
+
+            elif action_name == "tempcompreset":
+                foc_dev.reset_temp_comp()
+                resp.text = MethodResponse(req).json
+
+            elif action_name == "movestats":
+                resp.text = MethodResponse(req, value=json.dumps(foc_dev.move_stats())).json
+
+            elif action_name == "planstatus":
+                resp.text = MethodResponse(req, value=json.dumps(foc_dev.plan_status())).json
+
+            else:
+                resp.text = MethodResponse(req,
+                                InvalidValueException(f"Action '{action_name}' is not supported.")).json
+
+        except Exception as ex:
+            resp.text = MethodResponse(req,
+                            DriverException(0x500, f'Focuser.Action failed', ex)).json
 
 @before(PreProcessRequest(maxdev))
 class CommandBlind:
@@ -105,7 +152,11 @@ class Name():
 @before(PreProcessRequest(maxdev))
 class SupportedActions():
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse([], req).json  # Not PropertyNotImplemented
+        """
+        Returns the list of custom actions supported by the driver.
+        """
+        actions = ["tempcompsample", "tempcompstatus", "tempcompreset", "planstatus", "movestats"]
+        resp.text = PropertyResponse(actions, req).json
 
 @before(PreProcessRequest(maxdev))
 class connected:
@@ -1,11 +1,64 @@
-import serial
-import serial.tools.list_ports
 from logging import Logger
 
 from threading import Lock
 from threading import Timer
 
 import time
+import math
+from config import Config
+from devices.fitting import IncrementalFit
+from devices.transport import Transport
+
+class MovePlanner():
+    """Plans focuser moves so that the final approach takes up mechanical backlash.
+
+    The final approach is always made in the preferred ``direction``. A move
+    travelling the other way overshoots the target by ``backlash`` steps and
+    comes back. A short move in the preferred direction also overshoots if the
+    last approach was made the other way, as it would not take up all the slack.
+    """
+    def __init__(self, backlash: int, direction: int, max_speed: float, acceleration: float):
+        self.backlash = int(backlash)
+        self.direction = 1 if direction >= 0 else -1
+        self.max_speed = float(max_speed)           # steps/sec
+        self.acceleration = float(acceleration)     # steps/sec^2
+        self.last_direction = 0                     # Direction of the last approach, 0 = unknown
+
+    def plan(self, current: int, target: int, max_step: int) -> list:
+        """Returns the list of positions (legs) to move through to reach ``target``"""
+        delta = target - current
+        if delta == 0:
+            return []
+        if self.backlash > 0:
+            travel = 1 if delta > 0 else -1
+            slack = self.last_direction != self.direction and abs(delta) < self.backlash
+            if travel != self.direction or slack:
+                overshoot = min(max(target - self.direction * self.backlash, 0), max_step)
+                if overshoot != current and overshoot != target:
+                    return [overshoot, target]
+        return [target]
+
+    def commit(self, current: int, legs: list) -> None:
+        """Remember the approach direction of a plan that is being executed"""
+        if legs:
+            start = legs[-2] if len(legs) > 1 else current
+            if legs[-1] != start:
+                self.last_direction = 1 if legs[-1] > start else -1
+
+    def leg_time(self, distance: int) -> float:
+        """Travel time (sec) of one leg with a trapezoidal speed profile"""
+        distance = abs(distance)
+        ramp = self.max_speed * self.max_speed / self.acceleration
+        if distance >= ramp:
+            return distance / self.max_speed + self.max_speed / self.acceleration
+        return 2.0 * math.sqrt(distance / self.acceleration)
+
+    def travel_time(self, current: int, legs: list) -> float:
+        total = 0.0
+        for leg in legs:
+            total += self.leg_time(leg - current)
+            current = leg
+        return total
 
 class Focuser():
     def __init__(self, logger: Logger):  
@@ -31,20 +84,38 @@ class Focuser():
         self._tgt_position = 0
         self._stopped = True
 
-        self._serial = None
         self._timeout = 1
+        self._transport = Transport(logger, Config.foc_com_port, Config.foc_baudrate, self._timeout,
+                                    terminator='\n', encoding='utf-8', pre_delay=.05,
+                                    name='focuser', trace_dir=Config.trace_dir,
+                                    breaker_threshold=Config.foc_breaker_threshold,
+                                    probe_interval=Config.foc_probe_interval)
 
         self._timer: Timer = None
         self._interval: float = 1.0 / self._steps_per_sec
-    
-    def _ports(self):
-        self.list = serial.tools.list_ports.comports()
-        coms = []
-        for element in self.list:
-            coms.append(element.device)
+        self._probe_timer: Timer = None     # Recovery probe while the breaker is open
+        self._probe_interval: float = Config.foc_probe_interval
+
+        # Temperature compensation: best focus position vs. ambient temperature
+        self.temp_source = None         # Callable returning the ambient temperature (deg C)
+        self._temp_comp_model = IncrementalFit()
+        self._temp_comp_ref = None      # (position, temperature) when TempComp was enabled
+        self._temp_comp_timer: Timer = None
+        self._temp_comp_interval: float = Config.temp_comp_interval
+        self._temp_comp_min_samples: int = Config.temp_comp_min_samples
+        self._temp_comp_min_move: int = Config.temp_comp_min_move
 
-        return(coms)
+        # Backlash-aware move planning
+        self._planner = MovePlanner(Config.foc_backlash, Config.foc_approach_direction,
+                                    Config.foc_max_speed, Config.foc_acceleration)
+        self._legs = []                 # Remaining legs of the move in progress
+        self._planned_travel_time = 0.0
 
+        # Last-writer-wins coalescing of Move requests arriving during motion
+        self._coalesce_moves: bool = Config.foc_coalesce_moves
+        self._moves_total = 0
+        self._moves_merged = 0
+    
     @property
     def connected(self):
         self._lock.acquire()
@@ -53,24 +124,22 @@ class Focuser():
         return res
     @connected.setter
     def connected(self, connected: bool):
-        self._lock.acquire()
-        self._connected = connected
-        if connected and 'COM3' in self._ports():
+        if connected:
+            # Connected only once the port is open
+            try:
+                if not self._transport.available():
+                    raise RuntimeError(f'Port {self._transport.port} not available')
+                self._transport.open()
+            except Exception as e:
+                self.logger.error(f'[connect] {e}')
+                raise RuntimeError('Cannot Connect')
+            self._lock.acquire()
+            self._connected = True
             self._lock.release()
-            self._serial = serial.Serial(
-                port='COM3',
-                baudrate='9600',                
-                timeout=self._timeout
-            )
-            self._serial.close()
-            if not self._serial.is_open:
-                try: 
-                    self._serial.open()
-                    self._serial.flush() 
-                    time.sleep(1)                   
-                except:
-                    raise RuntimeError('Cannot Connect')
-        elif not connected:
+            self._start_probe()
+        else:
+            self._lock.acquire()
+            self._connected = False
             self._lock.release()
             self.disconnect()
         if self._connected:
@@ -79,22 +148,50 @@ class Focuser():
             self.logger.info('[disconnected]')
     
     def disconnect(self):
+        self._stop_temp_comp()
+        self._stop_probe()
+        try:
+            self._transport.close()
+        except:
+            raise RuntimeError('Cannot disconnect')
+    
+    def _start_probe(self) -> None:
+        if self._transport.breaker is None:
+            return
         self._lock.acquire()
-        if self._serial.is_open:
-            try:
-                self._serial.close()
-            except:
-                raise RuntimeError('Cannot disconnect')
+        if self._probe_timer is not None:
+            self._probe_timer.cancel()
+        self._probe_timer = Timer(self._probe_interval, self._probe_run)
+        self._probe_timer.daemon = True
+        self._probe_timer.start()
         self._lock.release()
-    
-    def start(self, from_run: bool = False) -> None:
+
+    def _stop_probe(self) -> None:
+        self._lock.acquire()
+        if self._probe_timer is not None:
+            self._probe_timer.cancel()
+        self._probe_timer = None
+        self._lock.release()
+
+    def _probe_run(self) -> None:
+        # With the breaker open, a position query lets it close again
+        # without waiting for a client command
+        if self._transport.breaker.is_open:
+            try:
+                self._write("P")
+            except RuntimeError:
+                pass
+        if self.connected:
+            self._start_probe()
+
+    def start(self, from_run: bool = False, delay: float = None) -> None:
         print('[start]')
         self._lock.acquire()
         print('[start] got lock')
         if from_run or self._stopped:
             self._stopped = False
             print('[start] new timer')
-            self._timer = Timer(self._interval, self._run)
+            self._timer = Timer(self._interval if delay is None else delay, self._run)
             print('[start] now start the timer')
             self._timer.start()
             print('[start] timer started')
@@ -105,10 +202,37 @@ class Focuser():
             print('[start] lock released')
     
     def _run(self) -> None:
+        try:
+            self._check_move()
+        except RuntimeError as e:
+            # Controller not answering (e.g. breaker open): keep the move
+            # and check again at the probe rate, unless it was stopped
+            self.logger.error(f'[_run] {e}')
+            self._lock.acquire()
+            stopped = self._stopped
+            self._lock.release()
+            if not stopped:
+                self.start(from_run = True, delay = self._probe_interval)
+
+    def _check_move(self) -> None:
         print('[_run] (tmr expired) get lock')
         self.position
         self._lock.acquire()
         delta = self._tgt_position - self._position
+        delay = None
+        if delta == 0 and self._legs:
+            # Reached an overshoot leg, return to the final target
+            leg = self._legs.pop(0)
+            delta = leg - self._position
+            delay = max(self._interval, self._planner.leg_time(delta))
+            try:
+                self._send_target(leg)
+            except RuntimeError:
+                # Not sent, retry the leg on the next check
+                self._legs.insert(0, leg)
+                self._tgt_position = self._position
+                self._lock.release()
+                raise
         self._lock.release()
         print(f'[_run] final delta={str(delta)}')
         if delta != 0:
@@ -124,7 +248,7 @@ class Focuser():
         print('[_run] lock released')
         if self._is_moving:
             print('[_run] more motion needed, start another timer interval')
-            self.start(from_run = True)
+            self.start(from_run = True, delay = delay)
     
     @property
     def temp(self):
@@ -148,17 +272,103 @@ class Focuser():
         return res
     @temp_comp.setter
     def temp_comp(self, temp: bool):
+        ref = None
+        if temp and self.temp_comp_available:
+            # Corrections are relative to the focus the user has right now,
+            # TempComp stays off if it cannot be read
+            position = self.position
+            if position < 0:
+                raise RuntimeError('Cannot read the focuser position')
+            ref = (position, self._read_temp())
         self._lock.acquire()
         if not self._temp_comp_available and temp:
             self._temp_comp = False
         elif self._temp_comp_available:        
             self._temp_comp = temp
-        self._lock.release()
+            if temp:
+                self._temp_comp_ref = ref
         res = self._temp_comp
-        if self._temp_comp:
-            self.logger.info(f'[temp_comp] {str(res)}')
+        self._lock.release()
+        if res:
+            self._start_temp_comp()
         else:
-            self.logger.info(f'[temp_comp] {str(res)}')
+            self._stop_temp_comp()
+        self.logger.info(f'[temp_comp] {str(res)}')
+
+    def _read_temp(self) -> float:
+        if self.temp_source is None:
+            raise RuntimeError('No ambient temperature source')
+        temp = float(self.temp_source())
+        self._lock.acquire()
+        self._temp = temp
+        self._lock.release()
+        return temp
+
+    def add_focus_sample(self, position: int = None):
+        """Record a best focus position (e.g. from autofocus) at the current ambient temperature"""
+        if position is None:
+            position = self.position
+        temp = self._read_temp()
+        self._temp_comp_model.add(temp, position)
+        available = self._temp_comp_model.count >= self._temp_comp_min_samples \
+                    and self._temp_comp_model.solve() is not None
+        self._lock.acquire()
+        self._temp_comp_available = available
+        self._lock.release()
+        self.logger.info(f'[temp_comp] sample pos={str(position)} temp={str(temp)}')
+
+    def reset_temp_comp(self):
+        """Forget all best focus samples and disable TempComp"""
+        self._lock.acquire()
+        self._temp_comp = False
+        self._temp_comp_available = False
+        self._lock.release()
+        self._stop_temp_comp()
+        self._temp_comp_model.reset()
+        self.logger.info('[temp_comp] reset')
+
+    def temp_comp_status(self) -> dict:
+        fit = self._temp_comp_model.solve()
+        return {
+            'Samples': self._temp_comp_model.count,
+            'Slope': fit[0] if fit else None,           # steps / deg C
+            'Available': self.temp_comp_available,
+            'Enabled': self.temp_comp,
+            'Reference': self._temp_comp_ref
+        }
+
+    def _start_temp_comp(self) -> None:
+        self._lock.acquire()
+        if self._temp_comp_timer is not None:
+            self._temp_comp_timer.cancel()
+        self._temp_comp_timer = Timer(self._temp_comp_interval, self._temp_comp_run)
+        self._temp_comp_timer.daemon = True
+        self._temp_comp_timer.start()
+        self._lock.release()
+
+    def _stop_temp_comp(self) -> None:
+        self._lock.acquire()
+        if self._temp_comp_timer is not None:
+            self._temp_comp_timer.cancel()
+        self._temp_comp_timer = None
+        self._lock.release()
+
+    def _temp_comp_run(self) -> None:
+        if not self.temp_comp:
+            return
+        try:
+            fit = self._temp_comp_model.solve()
+            if fit is not None and not self.is_moving:
+                ref_pos, ref_temp = self._temp_comp_ref
+                target = int(round(ref_pos + fit[0] * (self._read_temp() - ref_temp)))
+                target = min(max(target, 0), self._max_step)
+                if abs(target - self.position) >= self._temp_comp_min_move:
+                    self.logger.info(f'[temp_comp] correcting to {str(target)}')
+                    self._move(target)
+        except Exception as e:
+            self.logger.error(f'[temp_comp] {e}')
+        if self.temp_comp:
+            self._start_temp_comp()
 
     @property
     def position(self) -> int:
@@ -167,7 +377,7 @@ class Focuser():
         while retries < max_retries:
             try:
                 self._lock.acquire()
-                self._position = int(self._write("P\n"))
+                self._position = int(self._write("P"))
                 self.logger.debug(f'[position] {str(self._position)}')
                 self._lock.release()
                 print(f"[position] {self._position}")
@@ -177,6 +387,9 @@ class Focuser():
                 self.logger.error(f'Error reading position: {e}')
                 retries += 1  
                 self._lock.release() 
+            except RuntimeError:
+                self._lock.release()
+                raise
         
         return -1        
     
@@ -223,32 +436,90 @@ class Focuser():
 
     def move(self, position: int):
         self.logger.debug(f'[Move] pos={str(position)}')
+        if self.temp_comp:
+            raise RuntimeError('Invalid TempComp')
+        self._move(position)
+
+    def _move(self, position: int):
+        current = self.position
         self._lock.acquire()        
-        if self._is_moving:
+        merged = self._is_moving
+        if merged and not self._coalesce_moves:
             self._lock.release()
             raise RuntimeError('Cannot start a move while the focuser is moving')
         if position > self._max_step:
+            self._lock.release()
             raise RuntimeError('Invalid Steps')
-        if self._temp_comp:
-            raise RuntimeError('Invalid TempComp')
+        self._moves_total += 1
+        if merged:
+            # The firmware retargets an in-flight move, so the pending
+            # target is simply replaced and only the last one matters
+            self._moves_merged += 1
+        legs = self._planner.plan(current, position, self._max_step)
+        if not legs:
+            legs = [position]
+        self._planner.commit(current, legs)
+        self._planned_travel_time = self._planner.travel_time(current, legs)
+        self._legs = legs[1:]
+        try:
+            self._send_target(legs[0])
+        except RuntimeError:
+            self._legs = []
+            self._lock.release()
+            raise
+        delay = max(self._interval, self._planner.leg_time(legs[0] - current))
+        print('[move]', self._is_moving, legs)
+        self._lock.release() 
+        self.start(delay = delay) 
+
+    def _send_target(self, position: int):
+        # Lock must be held by the caller
         self._tgt_position = position 
-        resp = self._write(f"M{position}\n")
+        resp = self._write(f"M{position}")
         c = 0
         while not resp:
             if c >= 5:
                 self._is_moving = True
             c += 1     
-            resp = bool(self._write(f"M{position}\n"))   
+            resp = bool(self._write(f"M{position}"))   
         self._is_moving = bool(resp) 
-        print('[move]', self._is_moving)
-        self._lock.release() 
-        self.start() 
+
+    @property
+    def planned_travel_time(self) -> float:
+        """Estimated duration (sec) of the last planned move, including overshoot"""
+        self._lock.acquire()
+        res = self._planned_travel_time
+        self._lock.release()
+        return res
+
+    def move_stats(self) -> dict:
+        self._lock.acquire()
+        res = {
+            'Coalescing': self._coalesce_moves,
+            'Moves': self._moves_total,
+            'Merged': self._moves_merged
+        }
+        self._lock.release()
+        return res
+
+    def plan_status(self) -> dict:
+        self._lock.acquire()
+        res = {
+            'Backlash': self._planner.backlash,
+            'ApproachDirection': self._planner.direction,
+            'LastApproachDirection': self._planner.last_direction,
+            'PendingLegs': list(self._legs),
+            'PlannedTravelTime': self._planned_travel_time
+        }
+        self._lock.release()
+        return res
 
     def stop(self) -> None:
         self._lock.acquire()
         print('[stop] Stopping...')
         self._stopped = True
         self._is_moving = False
+        self._legs = []
         if self._timer is not None:
             self._timer.cancel()
         self._timer = None
@@ -256,18 +527,10 @@ class Focuser():
     
     def Halt(self) -> None:
         self.logger.debug('[Halt]')
-        self._write(f"S\n")
-        self.stop()        
+        try:
+            self._write("S")
+        finally:
+            self.stop()
     
     def _write(self, cmd):
-        if self._serial.is_open:
-            try:    
-                time.sleep(.05)            
-                self._serial.write(bytes(cmd, 'utf-8'))
-                ack = self._serial.readline().decode('utf-8').rstrip()                            
-                return ack
-            except Exception as e:
-                print("Error writing COM: "+ str(e))
-                return "Error"
-        else:
-            return "Not Open"
\ No newline at end of file
+        return self._transport.query(cmd)
\ No newline at end of file
@@ -0,0 +1,94 @@
+from threading import Lock
+import time
+
+class CircuitOpenError(RuntimeError):
+    """The controller is not answering, the command was not sent"""
+    pass
+
+class CircuitBreaker():
+    """Health of a device controller link.
+
+    After ``threshold`` consecutive failed exchanges (read timeouts or I/O
+    errors) the breaker opens and commands fail at once instead of each
+    waiting out the serial timeout. While open, one command every
+    ``probe_interval`` seconds is let through as a probe (normally the
+    status poller's); the first successful exchange closes the breaker.
+    """
+    def __init__(self, threshold: int = 3, probe_interval: float = 10.0):
+        self._lock = Lock()
+        self._threshold = threshold
+        self._probe_interval = probe_interval
+        self._failures = 0              # Consecutive
+        self._opened = None             # Time the breaker opened, None if closed
+        self._next_probe = 0.0
+        self._probing = False
+        self._total_failures = 0
+        self._trips = 0
+        self._rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        self._lock.acquire()
+        res = self._opened is not None
+        self._lock.release()
+        return res
+
+    def allow(self) -> bool:
+        """True if a command may be sent now"""
+        self._lock.acquire()
+        try:
+            if self._opened is None:
+                return True
+            now = time.monotonic()
+            if not self._probing and now >= self._next_probe:
+                self._probing = True
+                self._next_probe = now + self._probe_interval
+                return True
+            self._rejected += 1
+            return False
+        finally:
+            self._lock.release()
+
+    def success(self) -> bool:
+        """Record a good exchange, True if it closed the breaker"""
+        self._lock.acquire()
+        closed = self._opened is not None
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+        self._lock.release()
+        return closed
+
+    def failure(self) -> bool:
+        """Record a failed exchange, True if it opened the breaker"""
+        self._lock.acquire()
+        self._failures += 1
+        self._total_failures += 1
+        self._probing = False
+        tripped = self._opened is None and self._failures >= self._threshold
+        if tripped:
+            self._opened = time.monotonic()
+            self._next_probe = self._opened + self._probe_interval
+            self._trips += 1
+        self._lock.release()
+        return tripped
+
+    def retry_in(self) -> float:
+        """Seconds to the next probe, 0 if closed"""
+        self._lock.acquire()
+        res = 0.0 if self._opened is None else max(0.0, self._next_probe - time.monotonic())
+        self._lock.release()
+        return res
+
+    def status(self) -> dict:
+        self._lock.acquire()
+        res = {
+            'Open': self._opened is not None,
+            'OpenFor': None if self._opened is None else round(time.monotonic() - self._opened, 1),
+            'ConsecutiveFailures': self._failures,
+            'Failures': self._total_failures,
+            'Trips': self._trips,
+            'Rejected': self._rejected
+        }
+        self._lock.release()
+        return res
@@ -0,0 +1,111 @@
+from logging import Logger
+from threading import Lock, Thread, Event
+import time
+
+class Job():
+    """A long-running device operation running in its own thread.
+
+    The target is called as ``target(job, *args)`` and should return when
+    ``job.wait()`` reports the job was cancelled. It fails by raising.
+    """
+    def __init__(self, job_id: int, name: str, group: str, target, args: tuple):
+        self.id = job_id
+        self.name = name
+        self.group = group
+        self.state = 'running'          # running, done, failed, cancelled
+        self.error = None
+        self.progress = ''
+        self.started = time.time()
+        self.finished = None
+        self._target = target
+        self._args = args
+        self._cancel = Event()
+
+    @property
+    def running(self) -> bool:
+        return self.state == 'running'
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to ``timeout`` seconds, True if the job was cancelled"""
+        return self._cancel.wait(timeout)
+
+    def run(self, logger: Logger) -> None:
+        try:
+            self._target(self, *self._args)
+            self.state = 'cancelled' if self.cancelled else 'done'
+        except Exception as e:
+            self.error = str(e)
+            self.state = 'failed'
+            logger.error(f'[Job] {self.name} #{self.id} failed: {e}')
+        self.finished = time.time()
+        logger.info(f'[Job] {self.name} #{self.id} {self.state}')
+
+    def status(self) -> dict:
+        return {
+            'Id': self.id,
+            'Name': self.name,
+            'State': self.state,
+            'Progress': self.progress,
+            'Error': self.error,
+            'Started': self.started,
+            'Finished': self.finished
+        }
+
+class JobRegistry():
+    """Runs jobs in the background and keeps the recent ones for diagnostics.
+
+    Jobs in the same group drive the same mechanism (e.g. dome rotation),
+    so submitting a job cancels the one running in its group.
+    """
+    def __init__(self, logger: Logger, keep: int = 20):
+        self._lock = Lock()
+        self.logger = logger
+        self._keep = keep
+        self._jobs = []
+        self._next_id = 1
+
+    def submit(self, name: str, target, *args, group: str = None) -> Job:
+        self._lock.acquire()
+        if group is not None:
+            for job in self._jobs:
+                if job.group == group and job.running:
+                    job.cancel()
+        job = Job(self._next_id, name, group, target, args)
+        self._next_id += 1
+        self._jobs.append(job)
+        # Forget the oldest finished jobs, running ones must stay findable
+        finished = [j for j in self._jobs if not j.running]
+        for old in finished[:max(0, len(self._jobs) - self._keep)]:
+            self._jobs.remove(old)
+        self._lock.release()
+        thread = Thread(target=job.run, args=(self.logger,), name=f'job-{name}')
+        thread.daemon = True
+        thread.start()
+        self.logger.info(f'[Job] {name} #{job.id} started')
+        return job
+
+    def active(self, group: str) -> bool:
+        self._lock.acquire()
+        res = any(job.group == group and job.running for job in self._jobs)
+        self._lock.release()
+        return res
+
+    def cancel(self, group: str = None) -> None:
+        self._lock.acquire()
+        for job in self._jobs:
+            if job.running and (group is None or job.group == group):
+                job.cancel()
+        self._lock.release()
+
+    def status(self) -> list:
+        self._lock.acquire()
+        jobs = list(self._jobs)
+        self._lock.release()
+        return [job.status() for job in jobs]
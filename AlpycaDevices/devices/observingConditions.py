@@ -12,11 +12,12 @@
 # -----------------------------------------------------------------------------
 
 from falcon import Request, Response, HTTPBadRequest, before
+import json
 from logging import Logger
 from shr import PropertyResponse, MethodResponse, PreProcessRequest, \
                 get_request_field, to_bool
 from exceptions import *        # Nothing but exception classes
-from devices.observingDevice import ObservingConditions
+from devices.observingDevice import ObservingConditions, MAX_AVERAGE_PERIOD
 
 logger: Logger = None
 #logger = None                   # Safe on Python 3.7 but no intellisense in VSCode etc.
@@ -63,7 +64,23 @@ def start_obsC_device(logger: logger):
 @before(PreProcessRequest(maxdev))
 class action:
     def on_put(self, req: Request, resp: Response, devnum: int):
-        resp.text = MethodResponse(req, NotImplementedException()).json
+        if not obsC_dev.connected:
+            resp.text = MethodResponse(req, NotConnectedException()).json
+            return
+        try:
+            action_name = get_request_field('Action', req).lower()
+            if action_name == "weatherstats":
+                resp.text = MethodResponse(req, value=json.dumps(obsC_dev.weather_stats())).json
+            elif action_name == "weatherhistory":
+                # Parameters "hours" back from now or "start,end" ISO times
+                parameters = get_request_field('Parameters', req, default="")
+                resp.text = MethodResponse(req, value=json.dumps(obsC_dev.history(parameters))).json
+            else:
+                resp.text = MethodResponse(req,
+                                InvalidValueException(f"Action '{action_name}' is not supported.")).json
+        except Exception as ex:
+            resp.text = MethodResponse(req,
+                            DriverException(0x500, f'{self.__class__.__name__} failed', ex)).json
 
 @before(PreProcessRequest(maxdev))
 class commandblind:
@@ -109,7 +126,7 @@ class name():
 @before(PreProcessRequest(maxdev))
 class supportedactions():
     def on_get(self, req: Request, resp: Response, devnum: int):
-        resp.text = PropertyResponse([], req).json  # Not PropertyNotImplemented
+        resp.text = PropertyResponse(["weatherstats", "weatherhistory"], req).json
 
 @before(PreProcessRequest(maxdev))
 class connected:
@@ -161,6 +178,9 @@ class averageperiod:
         if avg < 0.0:
             resp.text = MethodResponse(req, InvalidValueException(f'AveragePeriod {avg} < 0.0')).json
             return
+        if avg > MAX_AVERAGE_PERIOD:
+            resp.text = MethodResponse(req, InvalidValueException(f'AveragePeriod {avg} > {MAX_AVERAGE_PERIOD}')).json
+            return
         try:
             # ----------------------
             obsC_dev.average_period = avg
@@ -1,17 +1,28 @@
 from logging import Logger
-from datetime import datetime, timezone
-from threading import Lock, Timer, Thread
+from datetime import timezone
+from threading import Lock
+from typing import NamedTuple
 from dateutil import parser
+import numpy as np
 import time
-import requests
 from config import Config
 from exceptions import *
+from devices.weather import WeatherSample, weather_service
+from devices.rolling import RollingWindow
+from devices.weatherStore import WeatherStore
 
-import warnings
-from urllib3.exceptions import InsecureRequestWarning
+# Columns of the averaging window, wind direction as unit vector components
+_COLUMNS = ('temperature', 'humidity', 'pressure', 'wind_speed', 'wind_sin', 'wind_cos', 'dew_point')
+MAX_AVERAGE_PERIOD = 12     # hours
 
-# Suprime o warning específico
-warnings.filterwarnings("ignore", category=InsecureRequestWarning)
+class Readings(NamedTuple):
+    """Values reported by the properties (ASCOM units), None if missing"""
+    temperature: float      # deg C
+    humidity: float         # percent
+    pressure: float         # hPa
+    wind_speed: float       # m/s
+    wind_direction: float   # deg
+    dew_point: float        # deg C
 
 class ObservingConditions():
     def __init__(self, logger: Logger):  
@@ -19,17 +30,16 @@ class ObservingConditions():
         self.name: str = 'LNA Observing Conditions'
         self.logger = logger
         
-        self._api_url = Config.api_url
-        self._status = {}
-        self._wind_speed: float = 0.0
-        self._wind_direction: float = 0.0
-        self._temperature: float = 0.0
-        self._humidity: float = 0.0
-        self._dew_point: float = 0.0
-        self._pressure: float = 0.0
+        self._service = weather_service(logger)
+        self._sample: WeatherSample = None
+        # Replaced as a whole on each sample, properties read it without locking
+        self._current = Readings(None, None, None, None, None, None)
         self._connected: bool = False
-        self._last_update = 3600
-        self._average_period = 12 # hours
+        self._average_period = Config.average_period # hours
+        # Room for MAX_AVERAGE_PERIOD of samples at the fastest fetch rate
+        capacity = int(MAX_AVERAGE_PERIOD * 3600 / Config.weather_min_interval) + 1
+        self._window = RollingWindow(len(_COLUMNS), capacity, self._average_period * 3600)
+        self._store = WeatherStore(logger, Config.weather_store_dir)
 
         self._sensor_descriptions = {
             'CloudCover': 'Not implemented',
@@ -46,32 +56,92 @@ class ObservingConditions():
             'WindGust': 'Not implemented',
             'WindSpeed': 'Wind Speed from weather station'
         }
-        self._loop_thread = Thread(target=self.get_status, daemon=True)
-    
-    def get_status(self):
-        while self._connected:
-            try: 
-                response = requests.get(self._api_url, timeout=5, verify=False)
-                if response.status_code == 200:                
-                    self._lock.acquire()
+        if self._service.sample is not None:
+            # Warm start from the reading restored by the service (already stored)
+            self._sample = self._service.sample
+            self._add(self._sample)
+            self._update_readings()
+    
+    def _on_sample(self, sample: WeatherSample):
+        # The poller and subscribe() may deliver the same sample at once
+        self._lock.acquire()
+        previous = self._sample
+        new = previous is None or sample.station_time > previous.station_time
+        if new:
+            self._sample = sample
+        self._lock.release()
+        if new:
+            self._add(sample)
+            try:
+                self._store.append(sample)
+            except OSError as e:
+                self.logger.error(f'[Weather store] {e}')
+        self._update_readings()
+
+    def _add(self, sample: WeatherSample) -> None:
+        values = [np.nan if v is None else v for v in (sample.temperature, sample.humidity,
+                                                       sample.pressure_hpa, sample.wind_speed_ms)]
+        if sample.wind_angle is None:
+            values += [np.nan, np.nan]
+        else:
+            angle = np.radians(sample.wind_angle)
+            values += [np.sin(angle), np.cos(angle)]
+        values.append(np.nan if sample.dew_point is None else sample.dew_point)
+        self._window.add(sample.station_time.timestamp(), values)
 
-                    self._status = response.json()
-                    # get time from station in str iso format
-                    now = datetime.now(timezone.utc)
-                    target = parser.isoparse(self._status.get('datetime'))
-                    self._last_update = (now - target).total_seconds()
+    def _update_readings(self) -> None:
+        # Averages over AveragePeriod, the latest values if it is 0 or
+        # shorter than the time between readings
+        self._lock.acquire()
+        try:
+            values = self._window.latest()
+            if self._average_period > 0:
+                means = self._window.means(time.time())
+                values = np.where(np.isnan(means), values, means)
+            v = dict(zip(_COLUMNS, (None if np.isnan(x) else float(x) for x in values)))
+            direction = None
+            if v['wind_sin'] is not None and v['wind_cos'] is not None:
+                # Circular mean, from the averaged unit vector
+                direction = float(round(np.degrees(np.arctan2(v['wind_sin'], v['wind_cos'])), 2) % 360.0)
+            self._current = Readings(v['temperature'], v['humidity'], v['pressure'],
+                                     v['wind_speed'], direction, v['dew_point'])
+        finally:
+            self._lock.release()
 
-                    self._lock.release()
-                else:
-                    raise RuntimeError(f'Error fetching data: {response.status_code}')                
-            except:
-                raise RuntimeError('Cannot Connect')
-            # wait 60 seconds to next update
-            time.sleep(30)
+    def _reading(self, field: str) -> float:
+        value = getattr(self._current, field)
+        if value is None:
+            raise RuntimeError(f'No {field} reading')
+        return value
+
+    def weather_stats(self) -> dict:
+        return self._service.stats()
+
+    def history(self, window: str) -> dict:
+        """Statistics of the stored readings over a window: "hours" back from
+        now, or "start,end" ISO times (UTC if no zone is given)"""
+        values = [v.strip() for v in window.split(',')]
+        if len(values) == 1:
+            end = time.time()
+            start = end - float(values[0]) * 3600
+        elif len(values) == 2:
+            start, end = (self._epoch(v) for v in values)
+        else:
+            raise RuntimeError('Window must be "hours" or "start,end"')
+        if end <= start:
+            raise RuntimeError('Window end must be after its start')
+        return self._store.statistics(start, end)
+
+    @staticmethod
+    def _epoch(value: str) -> float:
+        t = parser.isoparse(value)
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        return t.timestamp()
 
     def refresh(self):
         "Forces the device to immediately query its attached hardware to refresh sensor values"
-        pass
+        self._service.refresh()
 
     @property
     def connected(self):
@@ -85,19 +155,15 @@ class ObservingConditions():
         self._connected = connected
         if connected:
             self._lock.release()            
-            try: 
-                response = requests.get(self._api_url, timeout=5, verify=False)
-                if response.status_code == 200:
-                    self._status = response.json()
-                    self._lock.acquire()
-                    self._connected = True
-                    self._lock.release()
-                    self._loop_thread.start()
-                    self._last_update = 0
-                else:
-                    raise RuntimeError(f'Error fetching data: {response.status_code}')                
-            except:
-                raise RuntimeError('Cannot Connect')
+            self._service.subscribe(self._on_sample)
+            sample = self._service.sample
+            if sample is None or sample.age() >= Config.snapshot_max_age:
+                # No reading, or only an old restored one: need a live one
+                try:
+                    self._service.fetch()
+                except Exception:
+                    self.disconnect()
+                    raise RuntimeError('Cannot Connect')
         elif not connected:
             self._lock.release()
             self.disconnect()
@@ -110,17 +176,20 @@ class ObservingConditions():
         self._lock.acquire()
         self._connected = False
         self._lock.release()
-        if self._loop_thread.is_alive():
-            self._loop_thread.join(timeout=1)
+        self._service.unsubscribe(self._on_sample)
     
     @property
     def average_period(self):
         return self._average_period
     @average_period.setter
     def average_period(self, period: float):
+        if period < 0 or period > MAX_AVERAGE_PERIOD:
+            raise RuntimeError(f'AveragePeriod must be between 0 and {MAX_AVERAGE_PERIOD} hours')
         self._lock.acquire()
         self._average_period = period
         self._lock.release()
+        self._window.set_period(period * 3600, time.time())
+        self._update_readings()
 
     def sensor_description(self, sensor: str) -> str:
         "Description of the sensor providing the requested property"
@@ -134,34 +203,17 @@ class ObservingConditions():
     @property
     def dew_point(self) -> float:
         "Atmospheric dew point temperature (deg C) at the observatory"
-        try:
-            self._lock.acquire()
-            temp = float(self._status.get('temperature', 0))
-            hum = float(self._status.get('humidity', 0))
-            self._dew_point = temp - ((100 - hum) / 5)
-            self._lock.release()
-        except:
-            self._lock.release()
-            raise RuntimeError('Error calculating dew point')
-        return self._dew_point
+        return self._reading('dew_point')
     
     @property
     def humidity(self) -> float:
         "Atmospheric relative humidity (0.0 - 100.0 percent) at the observatory"
-        self._lock.acquire()
-        res = float(self._status.get('humidity', 0))
-        self._humidity = res
-        self._lock.release()
-        return res
+        return self._reading('humidity')
     
     @property
     def pressure(self) -> float:
         "Atmospheric pressure (hPa) at the observatory altitude"
-        self._lock.acquire()
-        res = float(self._status.get('bar', 0))
-        self._pressure = res * 1.33322 # convert mmHg to hPa
-        self._lock.release()
-        return self._pressure
+        return self._reading('pressure')
     
     @property
     def rain_rate(self) -> float:
@@ -186,20 +238,12 @@ class ObservingConditions():
     @property
     def temperature(self) -> float:
         "Atmospheric temperature (deg C) at the observatory"
-        self._lock.acquire()
-        res = float(self._status.get('temperature', 0))
-        self._temperature = res
-        self._lock.release()
-        return res
+        return self._reading('temperature')
     
     @property
     def wind_direction(self) -> float:
         "Direction (deg) from which the wind is blowing at the observatory"
-        self._lock.acquire()
-        res = float(self._status.get('wind_angle', 0))
-        self._wind_direction = res
-        self._lock.release()
-        return res
+        return self._reading('wind_direction')
     
     @property
     def wind_gust(self) -> float:
@@ -208,14 +252,13 @@ class ObservingConditions():
     @property
     def wind_speed(self) -> float:
         "Wind speed (m/s) at the observatory"
-        self._lock.acquire()
-        res = float(self._status.get('wind_speed', 0))
-        self._wind_speed = res / 3.6 #Convert km/h to m/s
-        self._lock.release()
-        return res
+        return self._reading('wind_speed')
     
     def time_last_update(self, sensor) -> float:
         description = self._sensor_descriptions.get(sensor, 'Unknown sensor')
         if description == 'Not implemented':
             return -1
-        return self._last_update
\ No newline at end of file
+        sample = self._sample
+        if sample is None:
+            return -1
+        return sample.age()
\ No newline at end of file
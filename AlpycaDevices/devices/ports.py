@@ -0,0 +1,124 @@
+import serial.tools.list_ports
+
+from threading import Lock, Thread
+import os
+import time
+
+class PortRegistry():
+    """Cached view of the local serial ports.
+
+    ``comports()`` is slow on hosts with many USB devices, so the ports
+    are enumerated once and re-enumerated only when the set of entries
+    in ``/dev`` changes (hot-plug). The watcher diffs the ``/dev``
+    listing, which is cheap, every ``interval`` seconds. Where there is
+    no ``/dev`` (Windows) it simply re-enumerates at that rate.
+
+    Besides plain device names, ports can be given by USB identity so
+    that renumbering after a reboot does not break the configuration::
+
+        usb:0403:6001           First port with this VID:PID
+        usb:0403:6001:A50285BI  VID:PID and USB serial number
+        usb-serial:A50285BI     USB serial number only
+    """
+    def __init__(self, interval: float = 2.0):
+        self._lock = Lock()
+        self._interval = interval
+        self._devices = set()
+        self._by_usb = {}               # (vid, pid) -> [device, ...]
+        self._by_serial = {}            # USB serial number -> device
+        self._dev_listing = None
+        self._thread: Thread = None
+        self._scans = 0
+
+    def _listing(self):
+        try:
+            return frozenset(os.listdir('/dev'))
+        except OSError:
+            return None
+
+    def refresh(self) -> None:
+        """Enumerate the ports now"""
+        listing = self._listing()
+        devices = set()
+        by_usb = {}
+        by_serial = {}
+        for info in serial.tools.list_ports.comports():
+            devices.add(info.device)
+            if info.vid is not None and info.pid is not None:
+                by_usb.setdefault((info.vid, info.pid), []).append(info.device)
+            if info.serial_number:
+                by_serial[info.serial_number] = info.device
+        for devs in by_usb.values():
+            devs.sort()
+        self._lock.acquire()
+        self._devices = devices
+        self._by_usb = by_usb
+        self._by_serial = by_serial
+        self._dev_listing = listing
+        self._scans += 1
+        self._lock.release()
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            listing = self._listing()
+            try:
+                if listing is None or listing != self._dev_listing:
+                    self.refresh()
+            except Exception:
+                pass                    # Try again on the next round
+
+    def _ensure(self) -> None:
+        self._lock.acquire()
+        started = self._thread is not None
+        if not started:
+            self._thread = Thread(target=self._watch, daemon=True)
+        self._lock.release()
+        if not started:
+            self.refresh()
+            self._thread.start()
+
+    @property
+    def devices(self) -> list:
+        self._ensure()
+        self._lock.acquire()
+        res = sorted(self._devices)
+        self._lock.release()
+        return res
+
+    def _lookup(self, port: str):
+        self._lock.acquire()
+        try:
+            if port.startswith('usb-serial:'):
+                return self._by_serial.get(port[len('usb-serial:'):])
+            if port.startswith('usb:'):
+                parts = port.split(':')
+                try:
+                    if len(parts) not in (3, 4):
+                        raise ValueError
+                    key = (int(parts[1], 16), int(parts[2], 16))
+                except ValueError:
+                    raise RuntimeError(f"Invalid port '{port}', expected usb:<vid>:<pid>[:<serial>] (hex ids)")
+                if len(parts) > 3:
+                    device = self._by_serial.get(parts[3])
+                    return device if device in self._by_usb.get(key, []) else None
+                devs = self._by_usb.get(key)
+                return devs[0] if devs else None
+            return port if port in self._devices else None
+        finally:
+            self._lock.release()
+
+    def resolve(self, port: str):
+        """Device name for ``port`` (name or USB identity), or None if absent"""
+        self._ensure()
+        device = self._lookup(port)
+        if device is None:
+            # Maybe plugged in since the last scan, look once more
+            self.refresh()
+            device = self._lookup(port)
+        return device
+
+    def __contains__(self, port: str) -> bool:
+        return self.resolve(port) is not None
+
+registry = PortRegistry()
@@ -0,0 +1,98 @@
+from threading import Lock
+import numpy as np
+
+class RollingWindow():
+    """Time window averages of several sensor columns over a fixed ring buffer.
+
+    Samples (a time stamp and one value per column, NaN if missing) go into
+    preallocated arrays of ``capacity`` rows, the oldest overwritten when
+    full. The window covers the samples of the last ``period`` seconds and
+    keeps running sums and counts per column, so adding a sample and
+    reading the means are O(1) (amortized, samples leave the window once).
+    Samples older than the window stay in the buffer, so widening the
+    period takes them back in.
+    """
+    def __init__(self, columns: int, capacity: int, period: float = 0.0):
+        self._lock = Lock()
+        self._capacity = capacity
+        self._times = np.zeros(capacity)
+        self._values = np.zeros((capacity, columns))
+        self._valid = np.zeros((capacity, columns), dtype=bool)
+        self._sums = np.zeros(columns)
+        self._counts = np.zeros(columns, dtype=np.int64)
+        self._n = 0                     # Samples added, index of the next one
+        self._size = 0                  # Samples in the buffer
+        self._start = 0                 # Index of the first sample in the window
+        self._period = period
+
+    def _enter(self, i: int) -> None:
+        row = i % self._capacity
+        self._sums += np.where(self._valid[row], self._values[row], 0.0)
+        self._counts += self._valid[row]
+
+    def _leave(self, i: int) -> None:
+        row = i % self._capacity
+        self._sums -= np.where(self._valid[row], self._values[row], 0.0)
+        self._counts -= self._valid[row]
+
+    def _trim(self, now: float) -> None:
+        # Lock must be held by the caller
+        while self._start < self._n and self._times[self._start % self._capacity] < now - self._period:
+            self._leave(self._start)
+            self._start += 1
+
+    def add(self, t: float, values) -> None:
+        values = np.asarray(values, dtype=float)
+        self._lock.acquire()
+        try:
+            if self._size == self._capacity:
+                oldest = self._n - self._capacity
+                if self._start <= oldest:
+                    self._leave(oldest)
+                    self._start = oldest + 1
+            row = self._n % self._capacity
+            self._times[row] = t
+            self._valid[row] = ~np.isnan(values)
+            self._values[row] = np.where(self._valid[row], values, 0.0)
+            self._n += 1
+            self._size = min(self._size + 1, self._capacity)
+            self._enter(self._n - 1)
+            self._trim(t)
+        finally:
+            self._lock.release()
+
+    def set_period(self, period: float, now: float) -> None:
+        self._lock.acquire()
+        try:
+            self._period = period
+            first = self._n - self._size
+            while self._start > first and \
+                    self._times[(self._start - 1) % self._capacity] >= now - period:
+                self._start -= 1
+                self._enter(self._start)
+            self._trim(now)
+        finally:
+            self._lock.release()
+
+    def means(self, now: float) -> np.ndarray:
+        """Mean of each column over the window ending at ``now``, NaN if no samples"""
+        self._lock.acquire()
+        try:
+            self._trim(now)
+            counts = self._counts.copy()
+            sums = self._sums.copy()
+        finally:
+            self._lock.release()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def latest(self) -> np.ndarray:
+        """Values of the newest sample, NaN if missing or none"""
+        self._lock.acquire()
+        try:
+            if self._n == 0:
+                return np.full(self._values.shape[1], np.nan)
+            row = (self._n - 1) % self._capacity
+            return np.where(self._valid[row], self._values[row], np.nan)
+        finally:
+            self._lock.release()
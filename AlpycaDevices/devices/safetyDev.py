@@ -1,14 +1,9 @@
 from logging import Logger
-from threading import Lock, Thread
-import time
-import requests
+from datetime import datetime, timezone
+from threading import Lock
+from dateutil import parser
 from config import Config
-
-import warnings
-from urllib3.exceptions import InsecureRequestWarning
-
-# Suprime o warning específico
-warnings.filterwarnings("ignore", category=InsecureRequestWarning)
+from devices.weather import WeatherSample, weather_service
 
 class SafetyMonitor():
     def __init__(self, logger: Logger):  
@@ -17,42 +12,55 @@ class SafetyMonitor():
         self.logger = logger
         
         self._connected: bool = False
-        self._api_url = Config.api_url
-        self._status = {}
+        self._service = weather_service(logger)
         self._is_safe = False
-        self._loop_thread = Thread(target=self.get_status, daemon=True)
+        # Warm start from the saved state if its reading is recent enough
+        saved = self._service.snapshot.get('safety')
+        if saved:
+            try:
+                age = (datetime.now(timezone.utc) - parser.isoparse(saved['station_time'])).total_seconds()
+                if age < Config.snapshot_max_age:
+                    self._is_safe = bool(saved['is_safe'])
+                    self.logger.info(f'[Safety] Restored IsSafe {self._is_safe} from a reading {age:.0f} sec old')
+            except (TypeError, ValueError, KeyError) as e:
+                self.logger.error(f'[Safety] Cannot restore state: {e}')
     
-    def get_status(self):
-        while self._connected:
-            try: 
-                response = requests.get(self._api_url, timeout=5, verify=False)
-                if response.status_code == 200:                
-                    self._lock.acquire()
-                    self._status = response.json()
-                    temp = float(self._status.get('temperature', 50))
-                    hum = float(self._status.get('humidity', 100))
-                    wind_speed = float(self._status.get('wind_speed', 50))
-                    leaf = float(self._status.get('leaf', 10))
-                    dew = temp - ((100 - hum) / 5)
-                    if hum < Config.max_humidity:
-                        self._is_safe = True
-                    elif wind_speed < Config.max_wind:
-                        self._is_safe = True
-                    elif temp > Config.min_temp and temp < Config.max_temp:
-                        self._is_safe = True
-                    elif leaf < Config.max_leaf:
-                        self._is_safe = True
-                    elif dew < Config.risk_dew:
-                        self._is_safe = True
-                    else:
-                        self._is_safe = False
-                    self._lock.release()
-                else:
-                    raise RuntimeError(f'Error fetching data: {response.status_code}')                
-            except:
-                raise RuntimeError('Cannot Connect')
-            # wait 60 seconds to next update
-            time.sleep(60)
+    def _on_sample(self, sample: WeatherSample):
+        # Missing sensors count as unsafe values
+        temp = sample.temperature if sample.temperature is not None else 50
+        hum = sample.humidity if sample.humidity is not None else 100
+        wind_speed = sample.wind_speed if sample.wind_speed is not None else 50
+        leaf = sample.leaf if sample.leaf is not None else 10
+        dew = sample.dew_point if sample.dew_point is not None else 50
+        if sample.age() >= Config.snapshot_max_age:
+            # Too old to judge from (e.g. a restored reading), and not saved
+            self._lock.acquire()
+            self._is_safe = False
+            self._lock.release()
+            return
+        self._lock.acquire()
+        if hum < Config.max_humidity:
+            self._is_safe = True
+        elif wind_speed < Config.max_wind:
+            self._is_safe = True
+        elif temp > Config.min_temp and temp < Config.max_temp:
+            self._is_safe = True
+        elif leaf < Config.max_leaf:
+            self._is_safe = True
+        elif dew < Config.risk_dew:
+            self._is_safe = True
+        else:
+            self._is_safe = False
+        is_safe = self._is_safe
+        self._lock.release()
+        # Saved by the service with the sample, after all subscribers
+        self._service.snapshot.set('safety', {'is_safe': is_safe,
+                                              'station_time': sample.station_time.isoformat()})
+        near = hum > Config.max_humidity - Config.humidity_margin or \
+               wind_speed > Config.max_wind - Config.wind_margin or \
+               temp < Config.min_temp + Config.temp_margin or \
+               temp > Config.max_temp - Config.temp_margin
+        self._service.set_fast(self._on_sample, near)
 
     @property
     def connected(self):
@@ -66,19 +74,15 @@ class SafetyMonitor():
         self._connected = connected
         if connected:
             self._lock.release()            
-            try: 
-                response = requests.get(self._api_url, timeout=5, verify=False)
-                if response.status_code == 200:
-                    self._status = response.json()
-                    self._lock.acquire()
-                    self._connected = True
-                    self._lock.release()
-                    self._loop_thread.start()
-                    self._last_update = 0
-                else:
-                    raise RuntimeError(f'Error fetching data: {response.status_code}')                
-            except:
-                raise RuntimeError('Cannot Connect')
+            self._service.subscribe(self._on_sample)
+            sample = self._service.sample
+            if sample is None or sample.age() >= Config.snapshot_max_age:
+                # No reading, or only an old restored one: need a live one
+                try:
+                    self._service.fetch()
+                except Exception:
+                    self.disconnect()
+                    raise RuntimeError('Cannot Connect')
         elif not connected:
             self._lock.release()
             self.disconnect()
@@ -91,11 +95,14 @@ class SafetyMonitor():
         self._lock.acquire()
         self._connected = False
         self._lock.release()
-        if self._loop_thread.is_alive():
-            self._loop_thread.join(timeout=1)
+        self._service.unsubscribe(self._on_sample)
     
     @property
     def is_safe(self) -> bool:
+        # Unsafe once the stations stop publishing, the last state may be stale
+        sample = self._service.sample
+        if sample is None or sample.age() >= Config.snapshot_max_age:
+            return False
         return self._is_safe
     
     
\ No newline at end of file
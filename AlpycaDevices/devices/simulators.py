@@ -0,0 +1,127 @@
+from threading import Lock
+import math
+import time
+
+from devices.transport import register_simulator
+
+# -----------------------------------------------------------------------------
+# In-process stand-ins for the serial controllers, used with the sim://
+# transport backend (e.g. com_port = 'sim://dome') to run the drivers
+# without hardware. Motion is computed from the elapsed time on each
+# command, there are no threads.
+# -----------------------------------------------------------------------------
+
+class FocuserSimulator():
+    """Focuser firmware (AccelStepper sketch) protocol: M<pos>, P, R, S"""
+    def __init__(self, speed: float = 1000.0):
+        self._lock = Lock()
+        self._speed = speed             # steps/sec
+        self._position = 0.0
+        self._target = 0
+        self._last = time.monotonic()
+
+    def _update(self):
+        now = time.monotonic()
+        step = self._speed * (now - self._last)
+        self._last = now
+        delta = self._target - self._position
+        if abs(delta) <= step:
+            self._position = float(self._target)
+        else:
+            self._position += math.copysign(step, delta)
+
+    def __call__(self, cmd: str) -> str:
+        self._lock.acquire()
+        try:
+            self._update()
+            if cmd.startswith('M'):
+                self._target = int(cmd[1:])
+                return '1'
+            if cmd == 'P':
+                return str(int(round(self._position)))
+            if cmd == 'R':
+                return str(int(self._position != self._target))
+            if cmd == 'S':
+                self._target = int(round(self._position))
+                return '1'
+            return None
+        finally:
+            self._lock.release()
+
+class DomeSimulator():
+    """Meade dome controller protocol as used by the LNA dome driver"""
+    def __init__(self, speed: float = 2.0, shutter_time: float = 30.0):
+        self._lock = Lock()
+        self._speed = speed                 # deg/sec
+        self._shutter_time = shutter_time   # sec
+        self._azimuth = 90.0
+        self._target = None
+        self._shutter_open = False
+        self._shutter_done = None           # Time the shutter motion completes
+        self._shutter_opening = False
+        self._last = time.monotonic()
+
+    @staticmethod
+    def _barcode(azimuth: float) -> int:
+        azimuth = azimuth % 360
+        if azimuth < 252:
+            return 855 + int(azimuth / 2)
+        return 675 + int(azimuth / 2)
+
+    @staticmethod
+    def _tag_azimuth(tag: int) -> float:
+        if tag >= 855:
+            return 2.0 * (tag - 855)
+        return 2.0 * (tag - 675)
+
+    def _update(self):
+        now = time.monotonic()
+        step = self._speed * (now - self._last)
+        self._last = now
+        if self._target is not None:
+            delta = (self._target - self._azimuth + 180) % 360 - 180
+            if abs(delta) <= step:
+                self._azimuth = self._target
+                self._target = None
+            else:
+                self._azimuth = (self._azimuth + math.copysign(step, delta)) % 360
+        if self._shutter_done is not None and now >= self._shutter_done:
+            self._shutter_open = self._shutter_opening
+            self._shutter_done = None
+
+    def _status(self) -> str:
+        bits = ['0'] * 8
+        bits[3] = '1' if self._target is not None else '0'
+        bits[6] = '1' if self._shutter_open else '0'
+        return f"{self._barcode(self._azimuth)} * {''.join(bits)}"
+
+    def _shutter(self, opening: bool):
+        self._shutter_opening = opening
+        self._shutter_done = time.monotonic() + self._shutter_time
+
+    def __call__(self, cmd: str) -> str:
+        self._lock.acquire()
+        try:
+            self._update()
+            if cmd == 'MEADE PROG STATUS':
+                return self._status()
+            if cmd.startswith('MEADE DOMO MOVER'):
+                self._target = self._tag_azimuth(int(cmd.split('=')[1]))
+                return 'ACK'
+            if cmd == 'MEADE DOMO PARAR':
+                self._target = None
+                return 'ACK'
+            if cmd == 'MEADE TRAPEIRA ABRIR':
+                self._shutter(True)
+                return 'ACK'
+            if cmd == 'MEADE TRAPEIRA FECHAR':
+                self._shutter(False)
+                return 'ACK'
+            if cmd.startswith('MEADE'):
+                return 'ACK'
+            return None
+        finally:
+            self._lock.release()
+
+register_simulator('focuser', FocuserSimulator())
+register_simulator('dome', DomeSimulator())
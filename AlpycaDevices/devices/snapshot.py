@@ -0,0 +1,60 @@
+from logging import Logger
+from threading import Lock
+import json
+import sys
+import os
+
+class Snapshot():
+    """Last known state, kept in a small JSON file to warm start from.
+
+    Sections (e.g. the latest weather sample, the safety state) are set in
+    memory and written together by save(), to a temporary file that then
+    replaces the snapshot, so a crash mid-write leaves the previous one.
+    A missing or unreadable file loads as empty.
+    """
+    def __init__(self, logger: Logger, path: str):
+        self._lock = Lock()
+        self.logger = logger
+        if path and not os.path.isabs(path):
+            path = f'{sys.path[0]}/{path}'
+        self.path = path
+        self._sections = {}
+        self.load()
+
+    def load(self) -> None:
+        sections = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    sections = json.load(f)
+                self.logger.info(f'[Snapshot] {", ".join(sections)} from {self.path}')
+            except (OSError, ValueError) as e:
+                self.logger.error(f'[Snapshot] Cannot load {self.path}: {e}')
+        self._lock.acquire()
+        self._sections = sections
+        self._lock.release()
+
+    def get(self, section: str):
+        self._lock.acquire()
+        res = self._sections.get(section)
+        self._lock.release()
+        return res
+
+    def set(self, section: str, value) -> None:
+        self._lock.acquire()
+        self._sections[section] = value
+        self._lock.release()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        self._lock.acquire()
+        try:
+            temp = f'{self.path}.tmp'
+            with open(temp, 'w') as f:
+                json.dump(self._sections, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        finally:
+            self._lock.release()
@@ -0,0 +1,149 @@
+from threading import Lock
+from bisect import bisect_left
+from urllib.parse import parse_qs
+import struct
+import time
+import os
+
+# -----------------------------------------------------------------------------
+# Binary traces of serial traffic
+#
+# A trace file is the 8 byte magic followed by records of
+#
+#   <d  time stamp (epoch seconds)
+#   B   direction, 0 = sent to the controller, 1 = received from it
+#   H   payload length
+#   ... payload bytes, exactly as on the wire (terminators included)
+#
+# TraceRecorder writes them from a Transport, ReplaySerial plays them back
+# to the drivers as a serial backend (port = 'replay://<file>?speed=<x>&skip=<n>').
+# -----------------------------------------------------------------------------
+
+MAGIC = b'ALTRACE1'
+TX = 0
+RX = 1
+_header = struct.Struct('<dBH')
+
+def read_trace(path: str):
+    """Yields ``(time, direction, payload)`` for each record of a trace file"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise RuntimeError(f'{path} is not a serial trace')
+        while True:
+            head = f.read(_header.size)
+            if len(head) < _header.size:
+                return
+            t, direction, length = _header.unpack(head)
+            payload = f.read(length)
+            if len(payload) < length:
+                return                  # Truncated by a crash, ignore the tail
+            yield t, direction, payload
+
+class TraceRecorder():
+    """Appends the traffic of one transport to a new trace file"""
+    def __init__(self, directory: str, name: str):
+        self._lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}.trace')
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC)
+        self._count = 0
+
+    def record(self, direction: int, payload: bytes) -> None:
+        self._lock.acquire()
+        try:
+            if self._file is None:
+                return
+            self._file.write(_header.pack(time.time(), direction, len(payload)))
+            self._file.write(payload)
+            self._count += 1
+            if self._count % 64 == 0:
+                self._file.flush()
+        finally:
+            self._lock.release()
+
+    def close(self) -> None:
+        self._lock.acquire()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+class ReplaySerial():
+    """Serial backend answering from a recorded trace.
+
+    Each command written is matched against the next recorded command and
+    answered with the reply recorded after it, delayed by the recorded
+    controller latency divided by ``speed`` (0 = no delay). If the drivers
+    send something the trace does not have next (e.g. after a change in
+    polling), the cursor resyncs on the next occurrence of that command
+    if it is at most ``skip`` exchanges ahead, or else the reply of its
+    nearest earlier occurrence (or the first one) is used and the cursor
+    stays. Occurrences are indexed per command when the trace is loaded.
+    """
+    def __init__(self, url: str, terminator: bytes):
+        path, _, query = url[len('replay://'):].partition('?')
+        params = parse_qs(query)
+        self._speed = float(params.get('speed', ['1'])[0])
+        self._skip = int(params.get('skip', ['256'])[0])
+        self._terminator = terminator
+        self._exchanges = []            # (command, reply, latency)
+        pending = None
+        for t, direction, payload in read_trace(path):
+            if direction == TX:
+                if pending is not None:
+                    self._exchanges.append((pending[1], b'', 0.0))
+                pending = (t, payload)
+            elif pending is not None:
+                self._exchanges.append((pending[1], payload, t - pending[0]))
+                pending = None
+        self._positions = {}            # command -> indices of its exchanges
+        for i, (command, _, _) in enumerate(self._exchanges):
+            self._positions.setdefault(command, []).append(i)
+        self._cursor = 0
+        self._tx = b''
+        self._rx = []
+        self.is_open = False
+        self.matched = 0
+        self.missed = 0
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        pass
+
+    def _answer(self, command: bytes):
+        positions = self._positions.get(command)
+        if not positions:
+            self.missed += 1
+            return b'', 0.0
+        k = bisect_left(positions, self._cursor)
+        if k < len(positions) and positions[k] - self._cursor <= self._skip:
+            i = positions[k]
+            self._cursor = i + 1
+            self.matched += 1
+        else:
+            i = positions[k - 1] if k > 0 else positions[0]
+            self.missed += 1
+        _, reply, latency = self._exchanges[i]
+        return reply, latency
+
+    def write(self, data: bytes) -> int:
+        self._tx += data
+        while self._terminator in self._tx:
+            line, self._tx = self._tx.split(self._terminator, 1)
+            reply, latency = self._answer(line + self._terminator)
+            if self._speed > 0 and latency > 0:
+                time.sleep(latency / self._speed)
+            if reply:
+                self._rx.append(reply)
+        return len(data)
+
+    def readline(self) -> bytes:
+        if self._rx:
+            return self._rx.pop(0)
+        return b''
@@ -0,0 +1,228 @@
+import serial
+from logging import Logger
+
+from threading import Lock
+import time
+
+from devices.ports import registry
+from devices.trace import TraceRecorder, ReplaySerial, TX, RX
+from devices.health import CircuitBreaker, CircuitOpenError
+
+# -----------------------------------------------------------------------------
+# Serial transport shared by the serial device drivers
+#
+# The port string selects the backend:
+#   COM3, /dev/ttyUSB0          Local serial port (pyserial)
+#   usb:0403:6001[:serial]      Local serial port by USB identity, see ports.py
+#   socket://host:port          Raw TCP serial bridge (ser2net etc.)
+#   rfc2217://host:port         RFC2217 (telnet) serial server
+#   loop://                     pyserial loopback, echoes what is written
+#   sim://<name>                In-process simulator, see register_simulator()
+#   replay://<file>?speed=<x>   Play back a recorded trace, see trace.py
+# -----------------------------------------------------------------------------
+
+_simulators = {}
+
+def register_simulator(name: str, responder):
+    """Make an in-process device simulator reachable as ``sim://<name>``
+
+    ``responder`` is called with each command line (without terminator)
+    and returns the reply line, or None for no reply (a read timeout).
+    """
+    _simulators[name] = responder
+
+def list_ports() -> list:
+    """Device names of the local serial ports"""
+    return registry.devices
+
+def is_url(port: str) -> bool:
+    return '://' in port
+
+class LoopbackSerial():
+    """Stand-in for ``serial.Serial`` that talks to an in-process responder"""
+    def __init__(self, responder, terminator: bytes, encoding: str):
+        self._responder = responder
+        self._terminator = terminator
+        self._encoding = encoding
+        self._tx = b''
+        self._rx = []
+        self.is_open = False
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._rx = []
+
+    def write(self, data: bytes) -> int:
+        if not self.is_open:
+            raise serial.SerialException('Port not open')
+        self._tx += data
+        while self._terminator in self._tx:
+            line, self._tx = self._tx.split(self._terminator, 1)
+            reply = self._responder(line.decode(self._encoding))
+            if reply is not None:
+                self._rx.append((str(reply) + '\r\n').encode(self._encoding))
+        return len(data)
+
+    def readline(self) -> bytes:
+        if not self.is_open:
+            raise serial.SerialException('Port not open')
+        if self._rx:
+            return self._rx.pop(0)
+        return b''                          # Same as a pyserial read timeout
+
+class Transport():
+    """Line oriented command/response link to a device controller.
+
+    Owns the connection lifecycle (open, close, reconnect) and the
+    framing (terminator, encoding, settling delays) so the drivers
+    only deal with command strings. Queries are serialized, a write
+    and its reply are never interleaved with another query. With a
+    ``breaker_threshold`` a circuit breaker makes queries fail fast
+    while the controller does not answer.
+    """
+    def __init__(self, logger: Logger, port: str, baudrate: int, timeout: float,
+                 terminator: str = '\n', encoding: str = 'utf-8',
+                 pre_delay: float = 0.0, post_delay: float = 0.0, open_delay: float = 1.0,
+                 name: str = 'serial', trace_dir: str = '',
+                 breaker_threshold: int = 0, probe_interval: float = 10.0):
+        self._lock = Lock()
+        self.logger = logger
+        self.name = name
+        self.port = port
+        self._baudrate = baudrate
+        self._timeout = timeout
+        self._terminator = terminator.encode(encoding)
+        self._encoding = encoding
+        self._pre_delay = pre_delay         # Wait before writing a command
+        self._post_delay = post_delay       # Wait between writing and reading the reply
+        self._open_delay = open_delay       # Settling time after opening (e.g. Arduino reset)
+        self._serial = None
+        self._virtual = False               # In-process backend, no settling delays needed
+        self._trace_dir = trace_dir         # Record traffic here if not empty
+        self._recorder: TraceRecorder = None
+        self.breaker = CircuitBreaker(breaker_threshold, probe_interval) if breaker_threshold > 0 else None
+
+    def available(self) -> bool:
+        """True if the port can be opened (remote URLs are assumed reachable)"""
+        if is_url(self.port):
+            return True
+        return self.port in registry
+
+    @property
+    def is_open(self) -> bool:
+        return self._serial is not None and self._serial.is_open
+
+    def _make_serial(self):
+        self._virtual = self.port.startswith(('sim://', 'replay://'))
+        if self.port.startswith('replay://'):
+            return ReplaySerial(self.port, self._terminator)
+        if self.port.startswith('sim://'):
+            name = self.port[len('sim://'):]
+            if name not in _simulators:
+                import devices.simulators   # Registers the built-in simulators
+            if name not in _simulators:
+                raise RuntimeError(f'Unknown simulator {name}')
+            return LoopbackSerial(_simulators[name], self._terminator, self._encoding)
+        port = self.port
+        if not is_url(port):
+            port = registry.resolve(port)
+            if port is None:
+                raise RuntimeError(f'Port {self.port} not found')
+        return serial.serial_for_url(port, baudrate=self._baudrate,
+                                     timeout=self._timeout, do_not_open=True)
+
+    def open(self):
+        self._lock.acquire()
+        try:
+            if not self.is_open:
+                self._serial = self._make_serial()
+                self._serial.open()
+                self._serial.flush()
+                if not self._virtual:
+                    time.sleep(self._open_delay)
+                if self._trace_dir and self._recorder is None:
+                    self._recorder = TraceRecorder(self._trace_dir, self.name)
+        finally:
+            self._lock.release()
+        self.logger.info(f'[transport] opened {self.port}')
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if self.is_open:
+                self._serial.close()
+            if self._recorder is not None:
+                self._recorder.close()
+                self._recorder = None
+        finally:
+            self._lock.release()
+
+    def _reconnect(self):
+        # Lock must be held by the caller
+        try:
+            self._serial.close()
+        except Exception:
+            pass
+        self._serial = self._make_serial()
+        self._serial.open()
+        self._serial.flush()
+
+    def _exchange(self, data: bytes) -> str:
+        if self._pre_delay and not self._virtual:
+            time.sleep(self._pre_delay)
+        self._serial.write(data)
+        if self._recorder is not None:
+            self._recorder.record(TX, data)
+        if self._post_delay and not self._virtual:
+            time.sleep(self._post_delay)
+        line = self._serial.readline()
+        if self._recorder is not None:
+            self._recorder.record(RX, line)
+        return line.decode(self._encoding).rstrip()
+
+    def query(self, cmd: str) -> str:
+        """Send a command and return the reply line ('' on read timeout)
+
+        Returns "Not Open" if the port is closed and "Error" if the
+        exchange failed even after reopening the port once. Raises
+        CircuitOpenError while the circuit breaker is open.
+        """
+        data = cmd.encode(self._encoding) + self._terminator
+        self._lock.acquire()
+        try:
+            if not self.is_open:
+                return "Not Open"
+            if self.breaker is not None and not self.breaker.allow():
+                raise CircuitOpenError(f'{self.name} controller not responding, '
+                                       f'next try in {self.breaker.retry_in():.0f}s')
+            reply = self._query(data)
+        finally:
+            self._lock.release()
+        if self.breaker is not None:
+            if reply and reply != "Error":
+                if self.breaker.success():
+                    self.logger.warning(f'[transport] {self.name} controller answering again')
+            elif self.breaker.failure():
+                self.logger.error(f'[transport] {self.name} controller not responding, failing fast')
+        return reply
+
+    def _query(self, data: bytes) -> str:
+        # Lock must be held by the caller
+        try:
+            return self._exchange(data)
+        except Exception as e:
+            self.logger.warning(f'[transport] {self.port}: {e}, reconnecting')
+        try:
+            self._reconnect()
+            return self._exchange(data)
+        except Exception as e:
+            self.logger.error(f'[transport] {self.port}: {e}')
+            return "Error"
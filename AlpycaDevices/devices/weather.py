@@ -0,0 +1,570 @@
+from logging import Logger
+from datetime import datetime, timezone, timedelta
+from threading import Lock, Timer, Condition
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import NamedTuple
+from dateutil import parser
+import numpy as np
+import json
+import math
+import re
+import time
+import requests
+from config import Config
+from devices.snapshot import Snapshot
+from devices.weatherFusion import fuse
+
+import warnings
+from urllib3.exceptions import InsecureRequestWarning
+
+# Suprime o warning específico
+warnings.filterwarnings("ignore", category=InsecureRequestWarning)
+
+class WeatherSample(NamedTuple):
+    """One weather station reading, in the station's units, with the
+    derived values computed once when it is parsed"""
+    station_time: datetime  # Time of the reading at the station (UTC)
+    received: float         # Epoch seconds it was fetched
+    temperature: float      # deg C
+    humidity: float         # percent
+    bar: float              # mmHg
+    wind_speed: float       # km/h
+    wind_angle: float       # deg
+    leaf: float             # Leaf wetness
+    dew_point: float        # deg C
+    pressure_hpa: float     # hPa
+    wind_speed_ms: float    # m/s
+
+    def age(self) -> float:
+        """Seconds since the station took the reading"""
+        return (datetime.now(timezone.utc) - self.station_time).total_seconds()
+
+    def to_dict(self) -> dict:
+        res = self._asdict()
+        res['station_time'] = self.station_time.isoformat()
+        return res
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'WeatherSample':
+        return cls(**dict(values, station_time=parser.isoparse(values['station_time'])))
+
+def _number(payload: dict, key: str):
+    value = payload.get(key)
+    return None if value is None else float(value)
+
+def dew_point(temperature: float, humidity: float):
+    """Dew point (deg C) with the Magnus formula, None if it cannot be computed"""
+    if temperature is None or humidity is None or humidity <= 0:
+        return None
+    gamma = math.log(humidity / 100.0) + 17.62 * temperature / (243.12 + temperature)
+    return 243.12 * gamma / (17.62 - gamma)
+
+def make_sample(station_time: datetime, received: float, temperature: float, humidity: float,
+                bar: float, wind_speed: float, wind_angle: float, leaf: float) -> WeatherSample:
+    """Sample from the station values, with the derived ones"""
+    return WeatherSample(station_time, received, temperature, humidity, bar, wind_speed,
+                         wind_angle, leaf, dew_point(temperature, humidity),
+                         None if bar is None else bar * 1.33322,                  # mmHg to hPa
+                         None if wind_speed is None else wind_speed / 3.6)        # km/h to m/s
+
+def parse_sample(payload: dict, received: float) -> WeatherSample:
+    """Typed sample from the weather-now JSON, missing sensors are None"""
+    return make_sample(parser.isoparse(payload.get('datetime')), received,
+                       _number(payload, 'temperature'), _number(payload, 'humidity'),
+                       _number(payload, 'bar'), _number(payload, 'wind_speed'),
+                       _number(payload, 'wind_angle'), _number(payload, 'leaf'))
+
+class UpdateSchedule():
+    """When to fetch next, from the station's own update cadence.
+
+    The update period is the median spacing of the station time stamps
+    of the last new readings, and the publication delay the smallest gap
+    between a station time stamp and the fetch that first saw it. The
+    next fetch is due just after the next reading should be published.
+    A fetch that finds nothing new is retried after a tenth of the period,
+    doubling on each further miss.
+    """
+    def __init__(self, default: float, min_interval: float, max_interval: float,
+                 margin: float = 1.0, history: int = 8):
+        self._default = default
+        self._min = min_interval
+        self._max = max_interval
+        self._margin = margin           # Fetch this long (sec) after the expected publication
+        self._history = history
+        self._periods = []
+        self._latencies = []
+        self._last_station = None       # Epoch of the last new reading
+        self._misses = 0
+
+    @property
+    def period(self) -> float:
+        if len(self._periods) < 2:
+            return self._default
+        return float(np.median(self._periods))
+
+    def observe(self, station_time: float, received: float, new: bool) -> None:
+        if not new:
+            self._misses += 1
+            return
+        if self._last_station is not None and station_time > self._last_station:
+            self._periods = (self._periods + [station_time - self._last_station])[-self._history:]
+        self._latencies = (self._latencies + [received - station_time])[-self._history:]
+        self._last_station = station_time
+        self._misses = 0
+
+    def next_delay(self, now: float) -> float:
+        period = self.period
+        if self._last_station is None:
+            delay = period
+        elif self._misses:
+            delay = max(self._min, period / 10.0) * 2 ** (self._misses - 1)
+        else:
+            delay = self._last_station + period + min(self._latencies) + self._margin - now
+        return max(self._min, min(self._max, delay))
+
+    def status(self) -> dict:
+        return {
+            'Period': round(self.period, 1),
+            'Latency': round(min(self._latencies), 1) if self._latencies else None,
+            'Misses': self._misses
+        }
+
+# The station time stamp, found in the raw payload without parsing it
+_datetime_field = re.compile(rb'"datetime"\s*:\s*"([^"]*)"')
+
+class WeatherSource():
+    """One weather station endpoint.
+
+    Requests are conditional (ETag/Last-Modified) over a pooled HTTP
+    session, and a payload with the same station time stamp as the last
+    one is not parsed again. Keeps the last reading of the source and its
+    health, so stale or failing sources can be left out of the fusion.
+    """
+    def __init__(self, logger: Logger, url: str, timeout: float):
+        self._lock = Lock()
+        self.logger = logger
+        self.url = url
+        self._timeout = timeout
+        self._session = requests.Session()
+        self._session.verify = False
+        self._sample: WeatherSample = None
+        # Conditional requests
+        self._etag = None
+        self._last_modified = None
+        self._raw_datetime = None       # Time stamp of the last parsed payload
+        self._payload_size = 0
+        self._parse_time = 0.0          # Smoothed parse time (sec)
+        # Health
+        self._failures = 0              # Consecutive
+        self._error = None              # Last error message
+        self._rejected = 0              # Values rejected as outliers
+        self._response_time = None      # Smoothed (sec), None before the first answer
+        self._stats = {'Requests': 0, 'NotModified': 0, 'Unchanged': 0, 'Parsed': 0,
+                       'BytesReceived': 0, 'BytesSaved': 0, 'ParseTimeSaved': 0.0, 'Errors': 0}
+
+    @property
+    def sample(self) -> WeatherSample:
+        """Last reading of the source, None before the first one"""
+        self._lock.acquire()
+        res = self._sample
+        self._lock.release()
+        return res
+
+    def fetch(self) -> WeatherSample:
+        """Latest reading of the source, parsed only if it changed"""
+        start = time.monotonic()
+        try:
+            sample = self._fetch()
+        except Exception as e:
+            self._lock.acquire()
+            self._failures += 1
+            self._stats['Errors'] += 1
+            self._error = str(e)
+            first = self._failures == 1
+            self._lock.release()
+            if first:
+                self.logger.warning(f'[Weather] {self.url} failing: {e}')
+            raise
+        elapsed = time.monotonic() - start
+        self._lock.acquire()
+        recovered = self._failures > 0
+        self._failures = 0
+        self._error = None
+        self._response_time = elapsed if self._response_time is None \
+                              else 0.8 * self._response_time + 0.2 * elapsed
+        self._lock.release()
+        if recovered:
+            self.logger.info(f'[Weather] {self.url} recovered')
+        return sample
+
+    def _fetch(self) -> WeatherSample:
+        headers = {}
+        self._lock.acquire()
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        self._stats['Requests'] += 1
+        self._lock.release()
+        try:
+            response = self._session.get(self.url, timeout=self._timeout, headers=headers)
+        except requests.RequestException as e:
+            raise RuntimeError(f'Cannot Connect: {e}')
+        if response.status_code == 304:
+            self._lock.acquire()
+            self._stats['NotModified'] += 1
+            self._stats['BytesSaved'] += self._payload_size
+            self._stats['ParseTimeSaved'] += self._parse_time
+            sample = self._sample
+            self._lock.release()
+            return sample
+        if response.status_code != 200:
+            raise RuntimeError(f'Error fetching data: {response.status_code}')
+        content = response.content
+        match = _datetime_field.search(content)
+        raw_datetime = match.group(1) if match else None
+        self._lock.acquire()
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+        self._payload_size = len(content)
+        self._stats['BytesReceived'] += len(content)
+        unchanged = raw_datetime is not None and raw_datetime == self._raw_datetime \
+                    and self._sample is not None
+        if unchanged:
+            self._stats['Unchanged'] += 1
+            self._stats['ParseTimeSaved'] += self._parse_time
+            sample = self._sample
+        self._lock.release()
+        if unchanged:
+            return sample
+        start = time.perf_counter()
+        sample = parse_sample(json.loads(content), time.time())
+        elapsed = time.perf_counter() - start
+        self._lock.acquire()
+        self._raw_datetime = raw_datetime
+        self._parse_time = elapsed if not self._stats['Parsed'] else 0.8 * self._parse_time + 0.2 * elapsed
+        self._stats['Parsed'] += 1
+        self._sample = sample
+        self._lock.release()
+        return sample
+
+    def prompt(self, wait: float) -> bool:
+        """True if the last request succeeded and the source usually answers
+        well within ``wait`` (or has not answered yet)"""
+        self._lock.acquire()
+        res = self._failures == 0 and (self._response_time is None or self._response_time < wait / 2)
+        self._lock.release()
+        return res
+
+    def reject(self) -> None:
+        self._lock.acquire()
+        self._rejected += 1
+        self._lock.release()
+
+    def counters(self) -> dict:
+        self._lock.acquire()
+        res = dict(self._stats)
+        self._lock.release()
+        return res
+
+    def status(self, max_age: float) -> dict:
+        self._lock.acquire()
+        age = None if self._sample is None else round(self._sample.age(), 1)
+        res = {
+            'Url': self.url,
+            'Age': age,
+            'Stale': age is None or age >= max_age,
+            'Failures': self._failures,
+            'Error': self._error,
+            'Rejected': self._rejected,
+            'ResponseTime': None if self._response_time is None else round(self._response_time, 3)
+        }
+        self._lock.release()
+        return res
+
+class WeatherService():
+    """Single fetcher of the weather stations for all the devices using them.
+
+    Devices subscribe a callback on connect and unsubscribe on disconnect;
+    the stations are polled only while there is a subscriber, and each
+    reading is published to all. With several sources they are fetched
+    concurrently, each with its own timeout, and the readings no older
+    than source_max_age are fused (weatherFusion). Only sources that
+    answer well within source_wait are waited for, up to source_wait;
+    failing or slow ones are not, their readings join the next fusion,
+    and a source is not asked again while its request is pending.
+    Fetches follow the station's update cadence (UpdateSchedule); a
+    subscriber can ask for faster polling, e.g. near a safety limit. Only
+    one fetch is in flight at a time, concurrent callers share its result.
+    The latest reading is saved to a snapshot after each update (with
+    whatever state the subscribers set in it) and restored at startup.
+    """
+    def __init__(self, logger: Logger, url, interval: float, timeout: float = 5):
+        self._lock = Lock()
+        self.logger = logger
+        urls = [url] if isinstance(url, str) else list(url)
+        self._interval = interval
+        self._sources = [WeatherSource(logger, u, timeout) for u in urls]
+        self._executor = None
+        if len(self._sources) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=len(self._sources), thread_name_prefix='weather')
+        self._pending = {}              # Request of each source
+        self._wait = Config.source_wait
+        self._max_age = Config.source_max_age
+        self._threshold = Config.outlier_threshold
+        self._priority = {field: [int(i) for i in order] for field, order in Config.source_priority.items()}
+        self._fused_from = None         # (source, station time) of the readings last published
+        self._subscribers = []
+        self._sample: WeatherSample = None
+        self._timer: Timer = None
+        self._schedule = UpdateSchedule(interval, Config.weather_min_interval, Config.weather_max_interval)
+        self._fast_interval = Config.weather_fast_interval
+        self._fast = set()              # Subscribers asking for fast polling
+        self._min_interval = Config.weather_min_interval
+        self._max_interval = Config.weather_max_interval
+        self._errors = 0                # Consecutive failed polls
+        self._stats = {'Refreshes': 0, 'RefreshShared': 0, 'RefreshLimited': 0}
+        # Single flight fetches
+        self._flight = Condition()
+        self._in_flight = False
+        self._flight_result = None      # (sample, error) of the last fetch
+        self._last_fetch = 0.0
+        self._refresh_interval = Config.refresh_interval
+        # Warm start
+        self.snapshot = Snapshot(logger, Config.weather_snapshot_file)
+        saved = self.snapshot.get('sample')
+        if saved:
+            try:
+                self._sample = WeatherSample.from_dict(saved)
+                self.logger.info(f'[Weather] Restored reading {self._sample.age():.0f} sec old')
+            except (TypeError, ValueError, KeyError) as e:
+                self.logger.error(f'[Weather] Cannot restore reading: {e}')
+
+    @property
+    def sample(self) -> WeatherSample:
+        """Latest reading, None before the first fetch"""
+        self._lock.acquire()
+        res = self._sample
+        self._lock.release()
+        return res
+
+    def subscribe(self, callback) -> None:
+        self._lock.acquire()
+        if callback in self._subscribers:
+            self._lock.release()
+            return                  # Already connected
+        first = not self._subscribers
+        self._subscribers.append(callback)
+        sample = self._sample
+        delay = self._schedule.next_delay(time.time())
+        if self._last_fetch == 0.0:
+            delay = 0               # Restored reading only, fetch a current one now
+        self._lock.release()
+        if sample is not None:
+            callback(sample)
+            self._save_snapshot()   # With the state the new subscriber set
+        if first:
+            self._start_polling(delay)
+
+    def unsubscribe(self, callback) -> None:
+        self._lock.acquire()
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+        self._fast.discard(callback)
+        last = not self._subscribers
+        self._lock.release()
+        if last:
+            self._stop_polling()
+
+    def fetch(self) -> WeatherSample:
+        """Fetch a reading now, or wait for the fetch already in flight"""
+        with self._flight:
+            if self._in_flight:
+                self._flight.wait_for(lambda: not self._in_flight)
+                return self._flight_outcome()
+            self._in_flight = True
+        sample = error = None
+        try:
+            sample = self._fetch()
+        except Exception as e:
+            error = e
+        with self._flight:
+            self._in_flight = False
+            self._last_fetch = time.monotonic()
+            self._flight_result = (sample, error)
+            self._flight.notify_all()
+            return self._flight_outcome()
+
+    def _flight_outcome(self) -> WeatherSample:
+        # Condition must be held by the caller
+        sample, error = self._flight_result
+        if error is not None:
+            raise error
+        return sample
+
+    def refresh(self) -> WeatherSample:
+        """Fetch for a client: shares a fetch in flight, and returns the
+        latest reading if the last fetch is less than refresh_interval old"""
+        with self._flight:
+            self._lock.acquire()
+            self._stats['Refreshes'] += 1
+            if self._in_flight:
+                self._stats['RefreshShared'] += 1
+            elif time.monotonic() - self._last_fetch < self._refresh_interval:
+                self._stats['RefreshLimited'] += 1
+                self._lock.release()
+                return self.sample
+            self._lock.release()
+        return self.fetch()
+
+    def _fetch(self) -> WeatherSample:
+        if self._executor is None:
+            self._sources[0].fetch()
+        else:
+            self._fetch_all()
+        return self._fuse()
+
+    def _fetch_all(self) -> None:
+        # Called in the single flight only. Only the new requests to the
+        # sources answering promptly so far are waited for
+        pending = []
+        for source in self._sources:
+            request = self._pending.get(source)
+            if request is None or request.done():
+                request = self._executor.submit(source.fetch)
+                self._pending[source] = request
+                if source.prompt(self._wait):
+                    pending.append(request)
+        wait(pending, timeout=self._wait)
+
+    def _fuse(self) -> WeatherSample:
+        # Publish the fusion of the fresh source readings if they changed
+        readings = {i: source.sample for i, source in enumerate(self._sources) if source.sample is not None}
+        if not readings:
+            errors = [source.status(self._max_age)['Error'] for source in self._sources]
+            raise RuntimeError('; '.join(e for e in errors if e) or 'No weather reading')
+        fresh = {i: sample for i, sample in readings.items() if sample.age() < self._max_age}
+        if not fresh:
+            # Only stale readings, report the newest one as it is
+            newest = max(readings, key=lambda i: readings[i].station_time)
+            fresh = {newest: readings[newest]}
+        key = tuple(sorted((i, sample.station_time) for i, sample in fresh.items()))
+        self._lock.acquire()
+        if key == self._fused_from and self._sample is not None:
+            self._schedule.observe(None, None, False)
+            sample = self._sample
+            self._lock.release()
+            return sample
+        self._lock.release()
+        station_time = max(s.station_time for s in fresh.values())
+        received = max(s.received for s in fresh.values())
+        if len(fresh) == 1:
+            sample = next(iter(fresh.values()))
+        else:
+            values, rejected = fuse(fresh, self._priority, self._threshold)
+            for i, field in rejected:
+                self._sources[i].reject()
+            sample = make_sample(station_time, received, **values)
+        self._lock.acquire()
+        previous = self._sample
+        if self._executor is not None and previous is not None and sample.station_time <= previous.station_time:
+            # A change from a source other than the newest: keep the time
+            # of published samples increasing, so each one is recorded
+            sample = sample._replace(station_time=previous.station_time + timedelta(milliseconds=1))
+        self._fused_from = key
+        self._schedule.observe(station_time.timestamp(), received, True)
+        self._lock.release()
+        self._publish(sample)
+        return sample
+
+    def set_fast(self, callback, fast: bool) -> None:
+        """Ask for (or release) fast polling on behalf of a subscriber"""
+        self._lock.acquire()
+        if fast:
+            self._fast.add(callback)
+        else:
+            self._fast.discard(callback)
+        self._lock.release()
+
+    def stats(self) -> dict:
+        res = {}
+        for source in self._sources:
+            for key, value in source.counters().items():
+                res[key] = res.get(key, 0) + value
+        self._lock.acquire()
+        res.update(self._stats)
+        res['Schedule'] = self._schedule.status()
+        res['Fast'] = bool(self._fast)
+        res['ConsecutiveErrors'] = self._errors
+        self._lock.release()
+        res['ParseTimeSaved'] = round(res['ParseTimeSaved'] * 1000.0, 3)   # msec
+        res['Sources'] = [source.status(self._max_age) for source in self._sources]
+        return res
+
+    def _publish(self, sample: WeatherSample) -> None:
+        self._lock.acquire()
+        self._sample = sample
+        subscribers = list(self._subscribers)
+        self._lock.release()
+        for callback in subscribers:
+            try:
+                callback(sample)
+            except Exception as e:
+                self.logger.error(f'[Weather] {e}')
+        self.snapshot.set('sample', sample.to_dict())
+        self._save_snapshot()
+
+    def _save_snapshot(self) -> None:
+        try:
+            self.snapshot.save()
+        except OSError as e:
+            self.logger.error(f'[Snapshot] {e}')
+
+    def _start_polling(self, delay: float = None) -> None:
+        self._lock.acquire()
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = Timer(self._interval if delay is None else delay, self._poll_run)
+        self._timer.daemon = True
+        self._timer.start()
+        self._lock.release()
+
+    def _stop_polling(self) -> None:
+        self._lock.acquire()
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._lock.release()
+
+    def _poll_run(self) -> None:
+        failed = False
+        try:
+            self.fetch()
+        except Exception as e:
+            failed = True
+            self.logger.error(f'[Weather] {e}')
+        self._lock.acquire()
+        polling = bool(self._subscribers)
+        self._errors = self._errors + 1 if failed else 0
+        if self._errors:
+            # Back off while the stations are down
+            delay = min(self._max_interval, self._min_interval * 2 ** self._errors)
+        else:
+            delay = self._schedule.next_delay(time.time())
+            if self._fast:
+                delay = min(delay, self._fast_interval)
+        self._lock.release()
+        if polling:
+            self._start_polling(delay)
+
+_service: WeatherService = None
+_service_lock = Lock()
+
+def weather_service(logger: Logger) -> WeatherService:
+    """The shared weather service, created on first use"""
+    global _service
+    _service_lock.acquire()
+    if _service is None:
+        _service = WeatherService(logger, Config.api_url, Config.weather_interval, Config.source_timeout)
+    _service_lock.release()
+    return _service
@@ -0,0 +1,59 @@
+import numpy as np
+
+# Station fields fused across sources, and the spread (in the station's
+# units) always tolerated between sources, so sources that agree closely
+# do not make the median absolute deviation too small to trust
+FIELDS = ('temperature', 'humidity', 'bar', 'wind_speed', 'wind_angle', 'leaf')
+TOLERANCE = {
+    'temperature': 1.0,     # deg C
+    'humidity': 5.0,        # percent
+    'bar': 1.0,             # mmHg
+    'wind_speed': 5.0,      # km/h
+    'wind_angle': 30.0,     # deg
+    'leaf': 1.0
+}
+
+def _deviations(name: str, values: np.ndarray):
+    # Center of the values and the deviation of each from it, around the
+    # circle for wind direction
+    if name == 'wind_angle':
+        angles = np.radians(values)
+        mean = np.degrees(np.arctan2(np.sin(angles).mean(), np.cos(angles).mean()))
+        offsets = (values - mean + 180.0) % 360.0 - 180.0
+        center = float(np.median(offsets))
+        return float((mean + center) % 360.0), offsets - center
+    center = float(np.median(values))
+    return center, values - center
+
+def fuse(readings: dict, priority: dict, threshold: float = 3.0):
+    """Fused value of each field from the readings of several sources.
+
+    ``readings`` maps a source index to its WeatherSample. For each field
+    the values further than ``threshold`` scaled median absolute
+    deviations (but at least the field's TOLERANCE) from the median are
+    rejected. The value is that of the first source of the field's
+    ``priority`` list among the remaining ones, or their median. Returns
+    the fused values (None if no source has the field) and the (source,
+    field) pairs rejected.
+    """
+    fused = {}
+    rejected = []
+    for name in FIELDS:
+        sources = [i for i, sample in readings.items() if getattr(sample, name) is not None]
+        if not sources:
+            fused[name] = None
+            continue
+        values = np.array([getattr(readings[i], name) for i in sources], dtype=float)
+        center, deviations = _deviations(name, values)
+        mad = 1.4826 * float(np.median(np.abs(deviations)))
+        keep = np.abs(deviations) <= threshold * max(mad, TOLERANCE[name])
+        rejected += [(i, name) for i, k in zip(sources, keep) if not k]
+        kept = {i: v for i, v, k in zip(sources, values, keep) if k}
+        preferred = [i for i in priority.get(name, []) if i in kept]
+        if preferred:
+            fused[name] = float(kept[preferred[0]])
+        elif len(kept) < len(sources):
+            fused[name] = _deviations(name, np.array(list(kept.values())))[0]
+        else:
+            fused[name] = center
+    return fused, rejected
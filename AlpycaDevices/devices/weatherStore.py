@@ -0,0 +1,102 @@
+from logging import Logger
+from datetime import datetime, timezone, timedelta
+from threading import Lock
+import numpy as np
+import sys
+import os
+
+RECORD = np.dtype([('time', '<f8'),             # Station time, epoch seconds
+                   ('temperature', '<f4'),      # deg C
+                   ('humidity', '<f4'),         # percent
+                   ('pressure', '<f4'),         # hPa
+                   ('wind_speed', '<f4'),       # m/s
+                   ('wind_direction', '<f4'),   # deg
+                   ('dew_point', '<f4'),        # deg C
+                   ('leaf', '<f4')])            # Leaf wetness, NaN if missing
+SENSORS = RECORD.names[1:]
+PERCENTILES = (10, 50, 90)
+
+class WeatherStore():
+    """On-disk weather time series.
+
+    One append-only file of fixed size records (RECORD) per UTC day, named
+    weather-YYYYMMDD.bin, so the file name is the daily index and the
+    records are in time order inside it. Statistics memory map the day
+    files and binary search the time column, so only the pages of the
+    requested window are read, and reduce each sensor column with numpy.
+    """
+    def __init__(self, logger: Logger, directory: str):
+        self._lock = Lock()
+        self.logger = logger
+        if directory and not os.path.isabs(directory):
+            directory = f'{sys.path[0]}/{directory}'
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, day: datetime) -> str:
+        return os.path.join(self.directory, f'weather-{day.strftime("%Y%m%d")}.bin')
+
+    def append(self, sample) -> None:
+        """Append a WeatherSample to its day file"""
+        if not self.directory:
+            return
+        record = np.zeros(1, dtype=RECORD)
+        record['time'] = sample.station_time.timestamp()
+        for name, value in (('temperature', sample.temperature), ('humidity', sample.humidity),
+                            ('pressure', sample.pressure_hpa), ('wind_speed', sample.wind_speed_ms),
+                            ('wind_direction', sample.wind_angle), ('dew_point', sample.dew_point),
+                            ('leaf', sample.leaf)):
+            record[name] = np.nan if value is None else value
+        path = self._path(sample.station_time.astimezone(timezone.utc))
+        self._lock.acquire()
+        try:
+            with open(path, 'ab') as f:
+                size = f.tell()
+                if size % RECORD.itemsize:
+                    f.truncate(size - size % RECORD.itemsize)   # Torn write, drop it
+                f.write(record.tobytes())
+        finally:
+            self._lock.release()
+
+    def _columns(self, start: float, end: float):
+        # Memory mapped window of each day file between start and end
+        day = datetime.fromtimestamp(start, timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        while day.timestamp() <= end:
+            path = self._path(day)
+            day += timedelta(days=1)
+            if not os.path.exists(path):
+                continue
+            count = os.path.getsize(path) // RECORD.itemsize
+            if count == 0:
+                continue
+            records = np.memmap(path, dtype=RECORD, mode='r', shape=(count,))
+            times = records['time']
+            lo = np.searchsorted(times, start, side='left')
+            hi = np.searchsorted(times, end, side='right')
+            if hi > lo:
+                yield records[lo:hi]
+
+    def statistics(self, start: float, end: float) -> dict:
+        """Count, min, max, mean and percentiles per sensor between two epoch times"""
+        if not self.directory:
+            raise RuntimeError('Weather store is disabled')
+        chunks = list(self._columns(start, end))
+        res = {'Start': start, 'End': end, 'Samples': int(sum(len(c) for c in chunks))}
+        for name in SENSORS:
+            values = np.concatenate([c[name] for c in chunks]) if chunks else np.zeros(0, dtype='<f4')
+            values = values[~np.isnan(values)].astype(float)
+            stats = {'Count': int(len(values))}
+            if len(values) and name == 'wind_direction':
+                # Directions only have a circular mean
+                angles = np.radians(values)
+                mean = np.degrees(np.arctan2(np.sin(angles).mean(), np.cos(angles).mean()))
+                stats['Mean'] = float(round(mean, 2) % 360.0)
+            elif len(values):
+                stats['Min'] = round(float(values.min()), 3)
+                stats['Max'] = round(float(values.max()), 3)
+                stats['Mean'] = round(float(values.mean()), 3)
+                for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                    stats[f'P{p}'] = round(float(v), 3)
+            res[name] = stats
+        return res
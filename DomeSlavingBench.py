@@ -0,0 +1,80 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AlpycaDevices'))
+from devices.domeGeometry import dome_azimuth, equatorial_to_altaz, default_pier_side, \
+                                 predict_track, slave_decision, azimuth_difference
+
+# Simulated night of dome slaving: naive tolerance slaving vs. lookahead.
+# The telescope tracks a random sequence of fields, the dome rotates at a
+# fixed speed and the slaving engine runs every `interval` seconds.
+
+def simulate(fields, args, lookahead: float):
+    moves = 0
+    rotation = 0.0
+    dome = None
+    target = None
+    for ha0, dec, dwell in fields:
+        pier = int(default_pier_side(ha0))
+        for t in np.arange(0.0, dwell, args.interval):
+            ha = ha0 + t / 3600.0
+            if lookahead > 0:
+                alt, az = predict_track(ha, dec, args.latitude, lookahead * 60.0, args.step)
+            else:
+                alt, az = equatorial_to_altaz(ha, dec, args.latitude)
+            required = dome_azimuth(alt, az, args.latitude, args.radius,
+                                    (args.offset_n, args.offset_e, args.offset_u),
+                                    args.dec_offset, pier)
+            if dome is None:
+                dome = float(np.atleast_1d(required)[0])
+            new = slave_decision(required, dome, args.tolerance, target)
+            if new is not None:
+                target = new
+                moves += 1
+            if target is not None:
+                delta = float(azimuth_difference(target, dome))
+                step = min(abs(delta), args.speed * args.interval)
+                dome = (dome + np.copysign(step, delta)) % 360.0
+                rotation += step
+                if step == abs(delta):
+                    target = None
+    return moves, rotation
+
+def main():
+    ap = argparse.ArgumentParser(description='Dome slaving simulation benchmark')
+    ap.add_argument('--hours', type=float, default=10.0)
+    ap.add_argument('--dwell', type=float, default=45.0, help='Minutes per field')
+    ap.add_argument('--latitude', type=float, default=-22.5344)
+    ap.add_argument('--radius', type=float, default=3.0)
+    ap.add_argument('--offset-n', type=float, default=0.0)
+    ap.add_argument('--offset-e', type=float, default=0.0)
+    ap.add_argument('--offset-u', type=float, default=0.0)
+    ap.add_argument('--dec-offset', type=float, default=0.5)
+    ap.add_argument('--tolerance', type=float, default=4.0)
+    ap.add_argument('--speed', type=float, default=2.0, help='Dome speed (deg/s)')
+    ap.add_argument('--interval', type=float, default=5.0, help='Slaving period (s)')
+    ap.add_argument('--lookahead', type=float, default=30.0, help='Minutes')
+    ap.add_argument('--step', type=float, default=30.0, help='Track step (s)')
+    ap.add_argument('--seed', type=int, default=1)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    fields = []
+    total = 0.0
+    while total < args.hours * 3600.0:
+        dwell = args.dwell * 60.0
+        # Fields within 3 h of the meridian, above ~30 deg altitude most of the time
+        fields.append((rng.uniform(-3.0, 2.0), rng.uniform(-80.0, 20.0), dwell))
+        total += dwell
+    hours = total / 3600.0
+
+    print(f'{len(fields)} fields, {hours:.1f} h, tolerance {args.tolerance} deg')
+    print(f'{"policy":<22}{"moves/h":>10}{"rotation deg/h":>16}')
+    for name, lookahead in (('naive', 0.0), (f'lookahead {args.lookahead:g} min', args.lookahead)):
+        moves, rotation = simulate(fields, args, lookahead)
+        print(f'{name:<22}{moves / hours:>10.1f}{rotation / hours:>16.1f}')
+
+if __name__ == '__main__':
+    main()